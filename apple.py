@@ -1,28 +1,40 @@
-import pygame
-from numpy import random
-from board_config import BOARD_SIZE, BLOCK_SIZE
+from board_config import BOARD_SIZE
+from random_streams import SPAWN_BLOCK, get_uniforms
 
 
 class Apple:
-    """"Apple class defines the random apple movement and drawing methods."""
-    def __init__(self, parent_screen, seed):
-        self.surface = parent_screen
-        self.rng = random.default_rng(seed)
-        self.x = 0
-        self.y = 0
+    """"Apple class defines the random apple movement. Drawing is done by the render module. Positions are plain
+    ints taken from the stream of the game's key (see random_streams), so a game has the same apples alone or in a
+    BatchGame."""
+    __slots__ = ('key', 'spawns', 'draws', 'x', 'y')
+
+    def __init__(self, seed, spawns=None):
+        self.reset(seed, spawns)
+
+    def reset(self, seed, spawns=None):
+        # the first block of the stream (a list) is given when the blocks of many games are generated together
+        self.key = seed
+        self.spawns = spawns if spawns is not None else get_uniforms(seed, 0, SPAWN_BLOCK)[0].tolist()
+        self.draws = 0
         self.move()
 
     def __str__(self):
         return "Apple pos=({},{})".format(self.x, self.y)
 
-    def draw(self):
-        block = pygame.Rect(self.x * BLOCK_SIZE, self.y * BLOCK_SIZE, BLOCK_SIZE, BLOCK_SIZE)
-        pygame.draw.rect(self.surface, (255, 0, 0), block)
-        pygame.draw.rect(self.surface, (0, 0, 0), block, 2)
-
-    def move(self):
-        self.x = self.rng.integers(0, BOARD_SIZE[0])
-        self.y = self.rng.integers(0, BOARD_SIZE[1])
+    def next_uniform(self):
+        if self.draws == len(self.spawns):
+            self.spawns += get_uniforms(self.key, self.draws, SPAWN_BLOCK)[0].tolist()
+        self.draws += 1
+        return self.spawns[self.draws - 1]
+
+    def move(self, free_cells=None):
+        if free_cells is None:
+            self.x = int(self.next_uniform() * BOARD_SIZE[0])
+            self.y = int(self.next_uniform() * BOARD_SIZE[1])
+        else:
+            # free cells are flat indices x * BOARD_SIZE[1] + y
+            cell = free_cells[int(self.next_uniform() * len(free_cells))]
+            self.x, self.y = divmod(int(cell), BOARD_SIZE[1])
 
     # def move(self):
     #     self.x = self.rng.choice((1, 7)) * BOARD_SIZE[0] // 8
@@ -31,14 +43,18 @@ class Apple:
 
 if __name__ == "__main__":
 
+    import pygame
+    from board_config import BLOCK_SIZE
+    from render import draw_apple
+
     pygame.init()
     window_size = (BOARD_SIZE[0] * BLOCK_SIZE, BOARD_SIZE[1] * BLOCK_SIZE)
     surface = pygame.display.set_mode(window_size)
     surface.fill((255, 255, 255))
 
-    apple = Apple(surface)
+    apple = Apple(seed=0)
 
     for _ in range(10000):
         apple.move()
-        apple.draw()
+        draw_apple(surface, apple)
         pygame.display.flip()
@@ -0,0 +1,255 @@
+import numpy as np
+from board_config import BOARD_SIZE
+from random_streams import SPAWN_BLOCK, get_uniforms
+from vision import Vision
+from replay import Replay
+
+# directions follow the same order as Snake.directions = ('up', 'right', 'down', 'left')
+DELTA_X = np.array((0, 1, 0, -1))
+DELTA_Y = np.array((-1, 0, 1, 0))
+
+INITIAL_LENGTH = 3
+INITIAL_ENERGY = 60
+INITIAL_POSITION = (BOARD_SIZE[0] // 2, BOARD_SIZE[1] // 2)
+
+
+class BatchGame:
+    """"BatchGame plays the games of a whole population at once. The state of every game (body, direction, energy,
+    fitness, apple and game over flag) is kept in numpy arrays and all live snakes are moved together in each step,
+    following the same rules as Game.play. The networks of all snakes are evaluated together by a PopulationNetwork.
+    As in Snake, bodies are ring buffers with an occupancy grid, so moving and collision checks do not depend on the
+    length of the snakes. Loops are detected as in Game, with the state of every game packed into one integer."""
+    def __init__(self, network, seeds, vision=None, record=False, detect_cycles=True):
+        self.network = network
+        self.vision = vision if vision is not None else Vision()
+        self.population = network.population
+        self.length = INITIAL_LENGTH
+
+        # ring buffer bodies: segment i of game g is at column (head[g] + i) % capacity. Snakes never grow (as in
+        # Game.play, where increase is disabled), so the ring only needs one slot per segment
+        self.capacity = self.length
+        self.head = np.zeros(self.population, dtype=np.int64)
+        self.head_x = np.full(self.population, INITIAL_POSITION[0], dtype=np.int64)
+        self.head_y = np.full(self.population, INITIAL_POSITION[1], dtype=np.int64)
+        self.body_x = np.full((self.population, self.capacity), INITIAL_POSITION[0], dtype=np.int16)
+        self.body_y = np.full((self.population, self.capacity), INITIAL_POSITION[1], dtype=np.int16)
+
+        # occupancy grids with a border of one cell around the board, as in Snake.grid
+        self.grid = np.zeros((self.population, BOARD_SIZE[0] + 2, BOARD_SIZE[1] + 2), dtype=np.uint8)
+        self.grid[:, INITIAL_POSITION[0] + 1, INITIAL_POSITION[1] + 1] = self.length
+
+        self.direction = np.ones(self.population, dtype=np.int64)      # 'right'
+        self.energy = np.full(self.population, INITIAL_ENERGY, dtype=np.int64)
+        self.fitness = np.zeros(self.population, dtype=np.int64)
+        self.steps = np.zeros(self.population, dtype=np.int64)
+        self.apples = np.zeros(self.population, dtype=np.int64)
+        self.last_distance = np.zeros(self.population, dtype=np.int64)     # squared distance
+        self.game_over = np.zeros(self.population, dtype=bool)
+
+        # cycle detection: the last length - 1 moves (2 bits each) and the snapshots of Brent's algorithm
+        self.detect_cycles = detect_cycles
+        self.moves = np.zeros(self.population, dtype=np.int64)
+        self.snapshot = np.full(self.population, -1, dtype=np.int64)
+        self.snapshot_step = np.zeros(self.population, dtype=np.int64)
+        self.snapshot_fitness = np.zeros(self.population, dtype=np.int64)
+        self.power = np.ones(self.population, dtype=np.int64)
+        self.skipped_steps = np.zeros(self.population, dtype=np.int64)
+
+        # with record, the direction chosen by each game at each step is kept for replays
+        self.record = record
+        self.actions = np.zeros((self.population, INITIAL_ENERGY if record else 0), dtype=np.uint8)
+
+        # the apples of every game come from the stream of its key, as in Apple: the first block of every stream is
+        # generated for all games at once, and spawning an apple is a lookup in it
+        self.seeds = np.asarray(seeds, dtype=np.uint64)
+        self.spawns = get_uniforms(self.seeds, 0, SPAWN_BLOCK)
+        self.draws = np.full(self.population, 2, dtype=np.int64)
+        self.apple_x = (self.spawns[:, 0] * BOARD_SIZE[0]).astype(np.int64)
+        self.apple_y = (self.spawns[:, 1] * BOARD_SIZE[1]).astype(np.int64)
+
+    def get_inputs(self, alive):
+        return self.vision.get_inputs(self.head_x[alive], self.head_y[alive], self.apple_x[alive], self.apple_y[alive],
+                                      self.grid, alive)
+
+    def process_inputs(self, alive, inputs):
+        if alive.size == self.population:
+            output = self.network.feedforward(inputs)
+        else:
+            output = self.network.feedforward(inputs, alive)
+        self.direction[alive] = np.argmax(output, axis=1)
+
+        if self.record:
+            if self.steps[alive].max() >= self.actions.shape[1]:
+                self.actions = np.concatenate((self.actions, np.zeros_like(self.actions)), axis=1)
+            self.actions[alive, self.steps[alive]] = self.direction[alive]
+
+    def get_segment(self, games, i):
+        index = (self.head[games] + i) % self.capacity
+        return self.body_x[games, index], self.body_y[games, index]
+
+    def move(self, alive):
+        # free the tail cells
+        tail_x, tail_y = self.get_segment(alive, self.length - 1)
+        self.grid[alive, tail_x + 1, tail_y + 1] -= 1
+
+        # update snakes' heads
+        self.head_x[alive] += DELTA_X[self.direction[alive]]
+        self.head_y[alive] += DELTA_Y[self.direction[alive]]
+
+        head = (self.head[alive] - 1) % self.capacity
+        self.head[alive] = head
+        self.body_x[alive, head] = self.head_x[alive]
+        self.body_y[alive, head] = self.head_y[alive]
+        self.grid[alive, self.head_x[alive] + 1, self.head_y[alive] + 1] += 1
+
+        self.energy[alive] -= 1
+        self.steps[alive] += 1
+        self.moves[alive] = ((self.moves[alive] << 2) | self.direction[alive]) & ((1 << 2 * (self.length - 1)) - 1)
+
+    def next_uniform(self, ind):
+        # games that eat more apples than the block holds compute the rest of their stream on demand
+        draw = self.draws[ind]
+        self.draws[ind] += 1
+        if draw < SPAWN_BLOCK:
+            return self.spawns[ind, draw]
+        return get_uniforms(self.seeds[ind], draw, 1)[0, 0]
+
+    def move_apple(self, ind):
+        # choose among the free cells (flat indices x * BOARD_SIZE[1] + y), as in Game.move_apple
+        free_cells = np.flatnonzero(self.grid[ind, 1:-1, 1:-1] == 0)
+        if len(free_cells) > 0:
+            cell = free_cells[int(self.next_uniform(ind) * len(free_cells))]
+            self.apple_x[ind], self.apple_y[ind] = divmod(int(cell), BOARD_SIZE[1])
+
+    def collides_with_itself(self, alive):
+        # the head and the two segments after it can not be hit, as in Snake.collides_with_itself
+        head_x = self.head_x[alive]
+        head_y = self.head_y[alive]
+        others = self.grid[alive, head_x + 1, head_y + 1].astype(np.int64) - 1
+        if self.length > 2:
+            neck_x, neck_y = self.get_segment(alive, 2)
+            others -= (neck_x == head_x) & (neck_y == head_y)
+        return others > 0
+
+    def play(self):
+        alive = np.flatnonzero(~self.game_over)
+        if alive.size == 0:
+            return
+
+        # move snakes:
+        self.process_inputs(alive, self.get_inputs(alive))
+        self.move(alive)
+        head_x = self.head_x[alive]
+        head_y = self.head_y[alive]
+
+        # check if snakes ran out of energy:
+        game_over = self.energy[alive] < 0
+
+        # check if snakes collide with themselves:
+        game_over |= self.collides_with_itself(alive)
+
+        # check if snakes are out of board:
+        game_over |= (head_x < 0) | (head_x >= BOARD_SIZE[0]) | (head_y < 0) | (head_y >= BOARD_SIZE[1])
+
+        # check if snakes collide with apple:
+        ate = (head_x == self.apple_x[alive]) & (head_y == self.apple_y[alive])
+        if ate.any():
+            eaters = alive[ate]
+
+            # increase fitness:
+            self.fitness[eaters] += 100 + self.energy[eaters] * 2
+            self.apples[eaters] += 1
+
+            # snakes hit maximum length
+            if self.length >= BOARD_SIZE[0] * BOARD_SIZE[1]:
+                game_over |= ate
+
+            self.energy[eaters] += INITIAL_ENERGY
+            for ind in eaters:
+                self.move_apple(ind)
+            self.reset_cycle_detection(eaters)
+
+        self.game_over[alive] = game_over
+        self.update_fitness(alive)
+
+        if self.detect_cycles:
+            self.skip_cycles(alive[~game_over])
+
+    def reset_cycle_detection(self, games):
+        self.snapshot[games] = -1
+        self.snapshot_step[games] = self.steps[games]
+        self.snapshot_fitness[games] = self.fitness[games]
+        self.power[games] = 1
+
+    def get_state(self, games):
+        # head, apple and last moves in one integer, as the state tuple of Game.get_state
+        cells = BOARD_SIZE[0] * BOARD_SIZE[1]
+        head = self.head_x[games] * BOARD_SIZE[1] + self.head_y[games]
+        apple = self.apple_x[games] * BOARD_SIZE[1] + self.apple_y[games]
+        return ((head * cells + apple) << 2 * (self.length - 1)) | self.moves[games]
+
+    def skip_cycles(self, games):
+        """Skips the full repetitions of the loops found in the given (live) games, as Game.skip_cycles."""
+        games = games[self.steps[games] >= self.length - 1]
+        state = self.get_state(games)
+
+        looped = state == self.snapshot[games]
+        if looped.any():
+            found = games[looped]
+            period = self.steps[found] - self.snapshot_step[found]
+            skipped = self.energy[found] // period * period
+            self.fitness[found] += skipped // period * (self.fitness[found] - self.snapshot_fitness[found])
+            self.energy[found] -= skipped
+            if self.record:
+                for ind, ind_period, ind_skipped in zip(found, period, skipped):
+                    self.repeat_actions(ind, ind_period, ind_skipped)
+            self.steps[found] += skipped
+            self.skipped_steps[found] += skipped
+            self.reset_cycle_detection(found)
+
+        due = ~looped & (self.steps[games] - self.snapshot_step[games] >= self.power[games])
+        due_games = games[due]
+        self.snapshot[due_games] = state[due]
+        self.snapshot_step[due_games] = self.steps[due_games]
+        self.snapshot_fitness[due_games] = self.fitness[due_games]
+        self.power[due_games] *= 2
+
+    def repeat_actions(self, ind, period, skipped):
+        steps = self.steps[ind]
+        while steps + skipped >= self.actions.shape[1]:
+            self.actions = np.concatenate((self.actions, np.zeros_like(self.actions)), axis=1)
+        loop = self.actions[ind, steps - period:steps]
+        self.actions[ind, steps:steps + skipped] = np.tile(loop, skipped // period)
+
+    def update_fitness(self, alive):
+        delta_x = self.apple_x[alive] - self.head_x[alive]
+        delta_y = self.apple_y[alive] - self.head_y[alive]
+        distance = delta_x ** 2 + delta_y ** 2
+        self.fitness[alive] += np.where(distance < self.last_distance[alive], 1, -1)
+        self.last_distance[alive] = distance
+
+    def get_replay(self, ind):
+        return Replay(self.seeds[ind], self.actions[ind, :self.steps[ind]].tobytes(), self.fitness[ind])
+
+    def run(self):
+        while not self.game_over.all():
+            self.play()
+        return self.fitness
+
+
+if __name__ == "__main__":
+
+    import time
+    from neural_network import NeuralNetwork, PopulationNetwork
+
+    np.random.seed(0)
+    population = 500
+    vision = Vision(sensors=('apple', 'wall', 'body'), rays=8)
+    network = PopulationNetwork.from_networks([NeuralNetwork((vision.input_size, 5, 4)) for _ in range(population)])
+    batch = BatchGame(network, np.random.randint(999999, size=population), vision)
+
+    start = time.perf_counter()
+    batch.run()
+    elapsed = time.perf_counter() - start
+    print('{} games | {} steps | {:.3f} s | Fitness: Max={} \tMean={}'.format(
+        population, batch.steps.sum(), elapsed, batch.fitness.max(), batch.fitness.mean()))
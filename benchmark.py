@@ -0,0 +1,247 @@
+"""Headless benchmarks for the simulation, inference and genetic algorithm hot paths.
+
+Every board size runs in its own process (BOARD_SIZE is read when the modules are imported) and every case is
+measured for each population size. Results are written as JSON and can be compared against a stored baseline:
+
+    python benchmark.py --output results.json
+    python benchmark.py --baseline results.json --populations 100 1000
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import numpy as np
+
+POPULATIONS = (100, 1000, 10000, 100000)
+BOARDS = ('10,10', '20,20', '40,40')
+NN_HIDDEN = (5, 4)
+
+# Game.play and NeuralNetwork.feedforward run per individual, so they are measured on at most this many individuals
+SINGLE_LIMIT = 1000
+
+
+def best_time(function, repeat):
+    """Runs function repeat times and returns the fastest time together with its last result."""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def get_architecture():
+    from vision import Vision
+    return (Vision().input_size,) + NN_HIDDEN
+
+
+def bench_game_single(population, repeat):
+    from game import Game
+    import genetic_algorithm as ga
+
+    architecture = get_architecture()
+    population = min(population, SINGLE_LIMIT)
+    genomes = ga.random_genomes(population, architecture)
+
+    def play():
+        games = [Game(ga.reshape_parameters(genome, architecture), architecture=architecture, seed=ind)
+                 for ind, genome in enumerate(genomes)]
+        start = time.perf_counter()
+        for game in games:
+            while not game.game_over:
+                game.play()
+        return time.perf_counter() - start, sum(game.snake.steps for game in games)
+
+    elapsed, steps = min(play() for _ in range(repeat))
+    return steps / elapsed, 'steps/s', True
+
+
+def bench_game_batched(population, repeat):
+    from batch_game import BatchGame
+    from neural_network import PopulationNetwork
+    import genetic_algorithm as ga
+
+    architecture = get_architecture()
+    genomes = ga.random_genomes(population, architecture)
+    network = PopulationNetwork.from_genomes(genomes, architecture)
+
+    def play():
+        batch = BatchGame(network, np.arange(population))
+        start = time.perf_counter()
+        batch.run()
+        return time.perf_counter() - start, batch.steps.sum()
+
+    elapsed, steps = min(play() for _ in range(repeat))
+    return steps / elapsed, 'steps/s', True
+
+
+def get_inputs(population, architecture):
+    return np.random.randint(-20, 20, (population, architecture[0]))
+
+
+def bench_feedforward_single(population, repeat):
+    from neural_network import NeuralNetwork
+    import genetic_algorithm as ga
+
+    architecture = get_architecture()
+    population = min(population, SINGLE_LIMIT)
+    genomes = ga.random_genomes(population, architecture)
+    networks = [NeuralNetwork(architecture, ga.reshape_parameters(genome, architecture)) for genome in genomes]
+    inputs = get_inputs(population, architecture)
+
+    def feedforward():
+        for network, x in zip(networks, inputs):
+            network.feedforward(x)
+
+    elapsed, _ = best_time(feedforward, repeat)
+    return elapsed / population * 1e6, 'us/individual', False
+
+
+def bench_feedforward_compiled(population, repeat, quantize=False):
+    from neural_network import NeuralNetwork
+    import genetic_algorithm as ga
+
+    architecture = get_architecture()
+    population = min(population, SINGLE_LIMIT)
+    genomes = ga.random_genomes(population, architecture)
+    networks = [NeuralNetwork(architecture, ga.reshape_parameters(genome, architecture)).compile(quantize)
+                for genome in genomes]
+    inputs = get_inputs(population, architecture)
+
+    def feedforward():
+        for network, x in zip(networks, inputs):
+            network.feedforward(x)
+
+    elapsed, _ = best_time(feedforward, repeat)
+    return elapsed / population * 1e6, 'us/individual', False
+
+
+def bench_feedforward_int8(population, repeat):
+    return bench_feedforward_compiled(population, repeat, quantize=True)
+
+
+def bench_feedforward_batched(population, repeat):
+    from neural_network import PopulationNetwork
+    import genetic_algorithm as ga
+
+    architecture = get_architecture()
+    network = PopulationNetwork.from_genomes(ga.random_genomes(population, architecture), architecture)
+    inputs = get_inputs(population, architecture)
+
+    elapsed, _ = best_time(lambda: network.feedforward(inputs), repeat)
+    return elapsed / population * 1e6, 'us/individual', False
+
+
+def bench_genetic_algorithm(population, repeat):
+    import genetic_algorithm as ga
+
+    architecture = get_architecture()
+    genomes = ga.random_genomes(population, architecture)
+    fitness = np.random.randint(-100, 1000, population)
+
+    def next_generation():
+        mating_pool = genomes[ga.tournament_selection_population(fitness)]
+        children = ga.crossover_population(mating_pool, 0.7)
+        return ga.mutate_population(children, 0.1)
+
+    elapsed, _ = best_time(next_generation, repeat)
+    return elapsed * 1e3, 'ms/generation', False
+
+
+CASES = {
+    'game_single': bench_game_single,
+    'game_batched': bench_game_batched,
+    'feedforward_single': bench_feedforward_single,
+    'feedforward_compiled': bench_feedforward_compiled,
+    'feedforward_int8': bench_feedforward_int8,
+    'feedforward_batched': bench_feedforward_batched,
+    'genetic_algorithm': bench_genetic_algorithm,
+}
+
+
+def run_board(board, cases, populations, repeat):
+    """Runs the cases for one board size in a child process and returns its results."""
+    command = [sys.executable, os.path.abspath(__file__), '--worker', '--cases'] + list(cases) + \
+              ['--populations'] + [str(population) for population in populations] + ['--repeat', str(repeat)]
+    environment = dict(os.environ, SNAKE_BOARD_SIZE=board)
+    output = subprocess.run(command, env=environment, check=True, stdout=subprocess.PIPE).stdout
+    return json.loads(output)
+
+
+def run_worker(cases, populations, repeat):
+    from board_config import BOARD_SIZE
+
+    results = []
+    for case in cases:
+        for population in populations:
+            np.random.seed(0)
+            value, unit, higher_is_better = CASES[case](population, repeat)
+            results.append({'case': case, 'board': '{}x{}'.format(*BOARD_SIZE), 'population': population,
+                            'value': float(value), 'unit': unit, 'higher_is_better': higher_is_better})
+            print('{:<20} {:>7} {:>8} {:>14.3f} {}'.format(case, results[-1]['board'], population, value, unit),
+                  file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Prints the ratio of every result to the baseline and returns the number of regressions."""
+    reference = {(result['case'], result['board'], result['population']): result for result in baseline['results']}
+    regressions = 0
+    for result in results:
+        key = (result['case'], result['board'], result['population'])
+        if key not in reference:
+            continue
+        speedup = result['value'] / reference[key]['value']
+        if not result['higher_is_better']:
+            speedup = 1 / speedup
+        status = 'ok'
+        if speedup < 1 - tolerance:
+            status = 'REGRESSION'
+            regressions += 1
+        print('{:<20} {:>7} {:>8} speedup x{:.2f} {}'.format(*key, speedup, status))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks of the snake simulation, inference and GA hot paths')
+    parser.add_argument('--cases', nargs='+', default=list(CASES), choices=list(CASES))
+    parser.add_argument('--populations', nargs='+', type=int, default=list(POPULATIONS))
+    parser.add_argument('--boards', nargs='+', default=list(BOARDS), help='board sizes as width,height')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', help='results file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='slowdown reported as a regression')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        json.dump(run_worker(args.cases, args.populations, args.repeat), sys.stdout)
+        return
+
+    results = []
+    for board in args.boards:
+        results.extend(run_board(board, args.cases, args.populations, args.repeat))
+
+    report = {
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'results': results,
+    }
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,6 @@
+import os
 
-BOARD_SIZE = (20, 20)
+# the board size can be overridden with SNAKE_BOARD_SIZE="width,height" (used by the benchmarks)
+BOARD_SIZE = tuple(int(size) for size in os.environ.get('SNAKE_BOARD_SIZE', '20,20').split(','))
 BLOCK_SIZE = 10  # px
-BACKGROUND_COLOR = (150, 150, 150)
\ No newline at end of file
+BACKGROUND_COLOR = (150, 150, 150)
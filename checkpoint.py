@@ -0,0 +1,91 @@
+import os
+import numpy as np
+from vision import Vision
+
+STATE_FILE = 'state.npz'
+
+
+def get_genomes_file(generation_number):
+    return 'genomes_{:06d}.npy'.format(generation_number)
+
+
+def write_atomically(path, write):
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'wb') as file:
+        write(file)
+    os.replace(temporary_path, path)
+
+
+def save_checkpoint(world, directory):
+    """Writes the state of a world at the start of its current generation: the genome matrix as a plain .npy file
+    (which can be memory-mapped) and everything else, including the seed of the run, the keys of the current games,
+    the results of the last evaluation, the children of a steady-state run that are still being evaluated and the
+    state of the global random generator, in a small .npz file. The state file is replaced last, so a checkpoint
+    interrupted while writing leaves the previous one intact."""
+    os.makedirs(directory, exist_ok=True)
+    genomes_file = get_genomes_file(world.generation_number)
+    write_atomically(os.path.join(directory, genomes_file), lambda file: np.save(file, world.genomes))
+
+    rng_name, rng_keys, rng_position, rng_has_gauss, rng_cached_gaussian = np.random.get_state()
+    pending = list(world.pending_children.values())
+    state = {
+        'genomes_file': genomes_file,
+        'generation_number': world.generation_number,
+        'seed': world.seed,
+        'seeds': world.seeds,
+        'fitness_list': np.array(world.fitness_list),
+        'steps_list': np.array(world.steps_list, dtype=np.int64),
+        'apples_list': np.array(world.apples_list, dtype=np.int64),
+        'pending_genomes': np.concatenate([genomes for genomes, _ in pending] or [world.genomes[:0]]),
+        'pending_seeds': np.concatenate([seeds for _, seeds in pending] or [world.seeds[:0]]),
+        'mutation_rate': world.mutation_rate,
+        'crossover_rate': world.crossover_rate,
+        'nn_architecture': np.array(world.nn_architecture),
+        'sensors': np.array(world.vision.sensors),
+        'rays': world.vision.rays,
+        'rng_name': rng_name,
+        'rng_keys': rng_keys,
+        'rng_position': rng_position,
+        'rng_has_gauss': rng_has_gauss,
+        'rng_cached_gaussian': rng_cached_gaussian,
+    }
+    write_atomically(os.path.join(directory, STATE_FILE), lambda file: np.savez(file, **state))
+
+    # remove the genomes of older checkpoints
+    for file_name in os.listdir(directory):
+        if file_name.startswith('genomes_') and file_name.endswith('.npy') and file_name != genomes_file:
+            os.remove(os.path.join(directory, file_name))
+
+
+def has_checkpoint(directory):
+    return os.path.exists(os.path.join(directory, STATE_FILE))
+
+
+def load_checkpoint(world, directory, mmap=False):
+    """Restores a world from a checkpoint written by save_checkpoint, so it continues exactly where it stopped. With
+    mmap the genome matrix is memory-mapped read-only instead of read into memory."""
+    with np.load(os.path.join(directory, STATE_FILE)) as state:
+        genomes = np.load(os.path.join(directory, str(state['genomes_file'])), mmap_mode='r' if mmap else None)
+
+        world.vision = Vision(tuple(str(sensor) for sensor in state['sensors']), int(state['rays']))
+        world.nn_architecture = tuple(int(size) for size in state['nn_architecture'])
+        world.population = len(genomes)
+        world.genomes = genomes
+        world.generation_number = int(state['generation_number'])
+        world.seed = int(state['seed'])
+        world.fitness_list = state['fitness_list'].tolist()
+        world.steps_list = state['steps_list'].tolist()
+        world.apples_list = state['apples_list'].tolist()
+        # a steady-state run evaluates its pending children again before breeding new ones
+        world.pending_children = {}
+        if len(state['pending_genomes']) > 0:
+            world.pending_children[0] = (state['pending_genomes'], state['pending_seeds'].astype(np.uint64))
+        world.mutation_rate = float(state['mutation_rate'])
+        world.crossover_rate = float(state['crossover_rate'])
+        world.seeds = state['seeds'].astype(np.uint64)
+        if len(world.colors) != world.population:
+            world.colors = world.get_random_colors()
+
+        # restore the random state last, as drawing colours draws from it
+        np.random.set_state((str(state['rng_name']), state['rng_keys'], int(state['rng_position']),
+                             int(state['rng_has_gauss']), float(state['rng_cached_gaussian'])))
@@ -0,0 +1,167 @@
+import hashlib
+import multiprocessing
+import numbers
+import os
+from collections import OrderedDict
+import numpy as np
+from batch_game import BatchGame
+from neural_network import PopulationNetwork
+from random_streams import derive_keys
+
+
+AGGREGATES = ('mean', 'min')     # or a quantile between 0 and 1
+
+
+def get_trial_seeds(seeds, trials):
+    """Returns the seeds (stream keys) of the games of every individual, trials per individual and
+    individual-major. The first trial keeps the key of the individual's game; trial t uses the key derived from it
+    and t, so every trial can be played again on its own."""
+    seeds = np.asarray(seeds, dtype=np.uint64)[:, None]
+    trial_seeds = np.repeat(seeds, trials, axis=1)
+    trial_seeds[:, 1:] = derive_keys(seeds, np.arange(1, trials))
+    return trial_seeds.ravel()
+
+
+def is_quantile(aggregate):
+    return isinstance(aggregate, numbers.Real) and not isinstance(aggregate, bool) and 0 <= aggregate <= 1
+
+
+def check_aggregate(aggregate):
+    if not is_quantile(aggregate) and aggregate not in AGGREGATES:
+        raise ValueError("Unknown fitness aggregate '{}'".format(aggregate))
+
+
+def aggregate_fitness(fitness, aggregate='mean'):
+    """Reduces a (population, trials) fitness array to one score per individual: one of AGGREGATES or a quantile
+    between 0 and 1."""
+    check_aggregate(aggregate)
+    if is_quantile(aggregate):
+        return np.quantile(fitness, float(aggregate), axis=1)
+    if aggregate == 'min':
+        return fitness.min(axis=1)
+    return fitness.mean(axis=1)
+
+
+def evaluate_genomes(genomes, seeds, architecture, vision=None, record=False, trials=1, aggregate='mean'):
+    """Plays one game per genome and returns the fitness, steps and apples arrays, with record the replay of the best
+    game (None otherwise) and the number of steps skipped in loops. Genomes are the flattened parameters of each
+    individual and seeds the apple seed of each game, so the result does not depend on any global random state.
+
+    With trials > 1 every individual plays trials games on different apple seeds (see get_trial_seeds), all of them
+    in the same BatchGame. Its fitness is then the aggregate of the fitness of its games, its steps and apples are
+    the totals of its games, and the replay is the best game of the best individual."""
+    if trials > 1:
+        genomes = np.repeat(genomes, trials, axis=0)
+        seeds = get_trial_seeds(seeds, trials)
+
+    network = PopulationNetwork.from_genomes(genomes, architecture)
+    batch = BatchGame(network, seeds, vision, record)
+    batch.run()
+    fitness, steps, apples = batch.fitness, batch.steps, batch.apples
+
+    best_game = fitness.argmax()
+    if trials > 1:
+        games = fitness.reshape(-1, trials)
+        fitness = aggregate_fitness(games, aggregate)
+        steps = steps.reshape(-1, trials).sum(axis=1)
+        apples = apples.reshape(-1, trials).sum(axis=1)
+        best = fitness.argmax()
+        best_game = best * trials + games[best].argmax()
+
+    best_replay = batch.get_replay(best_game) if record else None
+    return fitness, steps, apples, best_replay, int(batch.skipped_steps.sum())
+
+
+def leave_process_group():
+    # Ctrl+C and signals sent to the whole process group (by timeout or a job scheduler) must only reach the main
+    # process, which stops the pool itself: a worker killed in the middle of a task would leave the pool waiting
+    # forever
+    if hasattr(os, 'setpgrp'):
+        os.setpgrp()
+
+
+class ParallelEvaluator:
+    """"Spreads the evaluation of a population over a pool of worker processes. Every worker receives a chunk of the
+    genome matrix together with the seeds of its games and plays them headless with a BatchGame (all the trials of
+    an individual in the same worker), so the fitness array is identical to the one of a serial evaluation."""
+    def __init__(self, workers=1):
+        self.workers = workers
+        self.pool = None
+        if workers > 1:
+            self.pool = multiprocessing.Pool(workers, leave_process_group)
+
+    def evaluate(self, genomes, seeds, architecture, vision=None, record=False, trials=1, aggregate='mean'):
+        genomes = np.asarray(genomes)
+        seeds = np.asarray(seeds)
+        if self.pool is None:
+            return evaluate_genomes(genomes, seeds, architecture, vision, record, trials, aggregate)
+
+        chunks = np.array_split(np.arange(len(genomes)), self.workers)
+        jobs = [(genomes[chunk], seeds[chunk], architecture, vision, record, trials, aggregate)
+                for chunk in chunks if chunk.size > 0]
+        fitness, steps, apples, replays, skipped_steps = zip(*self.pool.starmap(evaluate_genomes, jobs))
+
+        # the best replay of the first chunk holding the maximum fitness, as argmax over the whole population
+        best_replay = None
+        if record:
+            best_replay = replays[int(np.argmax([chunk_fitness.max() for chunk_fitness in fitness]))]
+        return (np.concatenate(fitness), np.concatenate(steps), np.concatenate(apples), best_replay,
+                sum(skipped_steps))
+
+    def close(self, terminate=False):
+        # terminate stops the workers at once, for a pool that may have been interrupted in the middle of a task
+        if self.pool is not None:
+            if terminate:
+                self.pool.terminate()
+            else:
+                self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+
+class FitnessCache:
+    """"Bounded LRU cache of evaluation results (fitness, steps, apples and an optional replay) keyed by a hash of the
+    genome and the seed of its game. A genome played on the same seed always scores the same, so a hit is exactly
+    the result the evaluation would give."""
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+
+    @staticmethod
+    def get_key(genome, seed):
+        data = np.ascontiguousarray(genome).tobytes() + int(seed).to_bytes(8, 'little')
+        return hashlib.blake2b(data, digest_size=16).digest()
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+
+if __name__ == "__main__":
+
+    import time
+    import genetic_algorithm as ga
+    from neural_network import NeuralNetwork
+
+    np.random.seed(0)
+    population = 2000
+    nn_architecture = (6, 5, 4)
+    genomes = np.array([ga.flatten_parameters(NeuralNetwork(nn_architecture).parameters, nn_architecture)
+                        for _ in range(population)])
+    seeds = np.random.randint(999999, size=population)
+
+    for workers in (1, multiprocessing.cpu_count()):
+        evaluator = ParallelEvaluator(workers)
+        start = time.perf_counter()
+        fitness, steps, apples, _, _ = evaluator.evaluate(genomes, seeds, nn_architecture)
+        print('{} workers | {:.3f} s | Fitness: Max={} \tMean={}'.format(
+            workers, time.perf_counter() - start, fitness.max(), fitness.mean()))
+        evaluator.close()
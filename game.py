@@ -1,5 +1,7 @@
 from snake import Snake
 from apple import Apple
+from vision import Vision
+from replay import Replay
 from board_config import *
 from numpy import random
 import math
@@ -7,43 +9,90 @@ import math
 
 class Game:
     """"Game class contains the Snake and Apple and defines the game rules. It also calculates the inputs for the
-    neural network and updates the fitness of the snake along the game."""
-    def __init__(self, parent_screen, parameters=None):
-        self.surface = parent_screen
-        self.seed = random.randint(999999)
-
-        self.snake = Snake(self.surface, parameters, initial_pos=(BOARD_SIZE[0] // 2, BOARD_SIZE[1] // 2))
-        self.apple = Apple(self.surface, self.seed)
+    neural network and updates the fitness of the snake along the game. Games do not depend on pygame and are drawn by
+    the render module. Between two apples a game is deterministic, so once a snake comes back to an earlier state it
+    loops until it runs out of energy; with detect_cycles those loops are found (Brent's algorithm over a small state
+    key) and their full repetitions are skipped, adding their fitness, steps and actions without playing them. A game
+    can be reset in place with a new seed and new parameters, to be reused instead of building a new one."""
+    __slots__ = ('seed', 'vision', 'snake', 'apple', 'last_distance', 'game_over', 'actions', 'detect_cycles',
+                 'snapshot', 'snapshot_step', 'snapshot_fitness', 'power', 'skipped_steps')
+
+    def __init__(self, parameters=None, vision=None, architecture=None, seed=None, detect_cycles=True, color=None,
+                 spawns=None):
+        self.seed = seed if seed is not None else random.randint(999999)
+        self.vision = vision if vision is not None else Vision()
+        if architecture is None:
+            architecture = (self.vision.input_size, 5, 4)
+
+        self.snake = Snake(parameters, architecture, initial_pos=(BOARD_SIZE[0] // 2, BOARD_SIZE[1] // 2), color=color)
+        self.apple = Apple(self.seed, spawns)
 
         self.last_distance = 0
         self.game_over = False
-
-    def reset(self):
-        self.snake.reset((BOARD_SIZE[0] // 2, BOARD_SIZE[1] // 2))
-        self.apple = Apple(self.surface, self.seed)
+        self.actions = bytearray()      # direction index chosen at every step, for replays
+
+        self.detect_cycles = detect_cycles
+        self.reset_cycle_detection()
+        self.skipped_steps = 0
+
+    def reset(self, seed=None, parameters=None, spawns=None):
+        """Restarts the game, with a new seed and new parameters for the network if given (and the first block of the
+        apple stream of the seed, see Apple)."""
+        if seed is not None:
+            self.seed = seed
+        self.snake.reset((BOARD_SIZE[0] // 2, BOARD_SIZE[1] // 2), parameters)
+        self.apple.reset(self.seed, spawns)
         self.last_distance = 0
         self.game_over = False
-
-    def get_apple_vision(self):
-        delta_x = self.apple.x - self.snake.x[0]
-        delta_y = self.apple.y - self.snake.y[0]
-        return delta_x, delta_y
-
-    def get_wall_vision(self):
-        left_vision = self.snake.x[0]
-        up_vision = self.snake.y[0]
-        right_vision = (BOARD_SIZE[0] - 1) - self.snake.x[0]
-        down_vision = (BOARD_SIZE[1] - 1) - self.snake.y[0]
-        return left_vision, up_vision, right_vision, down_vision
-
-    def get_body_vision(self):
-        pass
+        self.actions.clear()
+        self.reset_cycle_detection()
+        self.skipped_steps = 0
+
+    def reset_cycle_detection(self):
+        # the snapshot is the state saved by Brent's algorithm, taken again every time power steps have passed
+        self.snapshot = None
+        self.snapshot_step = self.snake.steps
+        self.snapshot_fitness = self.snake.fitness
+        self.power = 1
+
+    def get_state(self):
+        # the body is the head followed by the cells it left in its last length - 1 moves, so the head, those moves
+        # and the apple give the whole state (the last distance is the distance between the head and the apple)
+        moves = bytes(self.actions[len(self.actions) - self.snake.length + 1:])
+        return self.snake.head_x, self.snake.head_y, self.apple.x, self.apple.y, moves
+
+    def skip_cycles(self):
+        """Compares the state with the snapshot; when the snake is back in it, the loop between them is repeated
+        until the last repetition that ends with energy left, so the final steps (and the game over) are played as
+        usual."""
+        snake = self.snake
+        if snake.steps < snake.length - 1:
+            return              # the initial body is not yet made of moves
+
+        state = self.get_state()
+        if state == self.snapshot:
+            period = snake.steps - self.snapshot_step
+            cycles = snake.energy // period
+            snake.fitness += cycles * (snake.fitness - self.snapshot_fitness)
+            snake.energy -= cycles * period
+            snake.steps += cycles * period
+            self.actions += self.actions[-period:] * cycles
+            self.skipped_steps += cycles * period
+            self.reset_cycle_detection()
+        elif snake.steps - self.snapshot_step >= self.power:
+            self.snapshot = state
+            self.snapshot_step = snake.steps
+            self.snapshot_fitness = snake.fitness
+            self.power *= 2
+
+    def get_replay(self):
+        return Replay(self.seed, self.actions, self.snake.fitness)
 
     def get_inputs(self):
-        return self.get_apple_vision() + (0, 0, 0, 0)     # + self.get_wall_vision()
+        return self.vision.get_game_inputs(self.snake, self.apple)
 
     def update_fitness(self):
-        distance = get_distance(self.apple.x, self.apple.y, self.snake.x[0], self.snake.y[0])
+        distance = get_distance(self.apple.x, self.apple.y, self.snake.head_x, self.snake.head_y)
         if distance < self.last_distance:
             self.snake.fitness += 1
         else:
@@ -51,20 +100,18 @@ class Game:
         self.last_distance = distance
 
     def move_apple(self):
-        # TODO: get all available spaces and then choose one of them at random
-        apple_in_snake = True
-        while apple_in_snake:
-            self.apple.move()
-            apple_in_snake = False
-            for i in range(self.snake.length):
-                if is_collision(self.apple.x, self.apple.y, self.snake.x[i], self.snake.y[i]):
-                    apple_in_snake = True
-                    break
-
-    def play(self):
-        # move snake:
-        inputs = self.get_inputs()
-        self.snake.process_inputs(inputs)
+        free_cells = self.snake.get_free_cells()
+        if len(free_cells) > 0:
+            self.apple.move(free_cells)
+
+    def play(self, action=None):
+        # move snake (a given action replaces the neural network):
+        if action is None:
+            inputs = self.get_inputs()
+            self.snake.process_inputs(inputs)
+        else:
+            self.snake.set_direction(action)
+        self.actions.append(self.snake.current_direction_index)
         self.snake.move()
 
         # check if snake ran out of energy:
@@ -72,23 +119,22 @@ class Game:
             self.game_over = True
 
         # check if snake collides with itself:
-        for i in range(3, self.snake.length):
-            if is_collision(self.snake.x[0], self.snake.y[0],
-                            self.snake.x[i], self.snake.y[i]):
-                self.game_over = True
+        if self.snake.collides_with_itself():
+            self.game_over = True
 
         # check if snake is out of board:
-        if self.snake.x[0] < 0 or \
-                self.snake.x[0] >= BOARD_SIZE[0] or \
-                self.snake.y[0] < 0 or \
-                self.snake.y[0] >= BOARD_SIZE[1]:
+        if self.snake.head_x < 0 or \
+                self.snake.head_x >= BOARD_SIZE[0] or \
+                self.snake.head_y < 0 or \
+                self.snake.head_y >= BOARD_SIZE[1]:
             self.game_over = True
 
         # check if snake collides with apple:
-        if is_collision(self.apple.x, self.apple.y, self.snake.x[0], self.snake.y[0]):
+        if is_collision(self.apple.x, self.apple.y, self.snake.head_x, self.snake.head_y):
 
             # increase fitness:
             self.snake.fitness += 100 + self.snake.energy * 2
+            self.snake.apples += 1
 
             # snake hits maximum length
             if self.snake.length >= BOARD_SIZE[0] * BOARD_SIZE[1]:
@@ -97,12 +143,13 @@ class Game:
             # self.snake.increase()
             self.snake.reset_energy()
             self.move_apple()
+            self.reset_cycle_detection()
 
         self.update_fitness()
 
-    def draw(self):
-        self.snake.draw()
-        self.apple.draw()
+        # given actions (replays) are not a function of the state, so they can not be skipped
+        if self.detect_cycles and action is None and not self.game_over:
+            self.skip_cycles()
 
 
 def is_collision(x0, y0, x1, y1):
@@ -121,12 +168,13 @@ if __name__ == "__main__":
     import time
     import pygame
     from pygame import locals
+    from render import draw_game
 
     pygame.init()
     window_size = (BOARD_SIZE[0] * BLOCK_SIZE, BOARD_SIZE[1] * BLOCK_SIZE)
     surface = pygame.display.set_mode(window_size)
 
-    game = Game(surface, True, True)
+    game = Game()
 
     running = True
     paused = False
@@ -149,10 +197,10 @@ if __name__ == "__main__":
             game.play()
 
             if game.game_over:
-                game = Game(surface)
+                game = Game()
                 continue
 
             surface.fill((150, 150, 150))
-            game.draw()
+            draw_game(surface, game)
             pygame.display.flip()
             time.sleep(0.1)
@@ -1,5 +1,6 @@
 import numpy as np
 from numpy.random import randint, rand
+import selection
 
 
 def tournament_selection(parameters, fitness, number_of_competitors=3):
@@ -27,10 +28,66 @@ def crossover(parent_1, parent_2, crossover_rate):
 
 def mutation(chromosome, mutation_rate):
     new_chromosome = chromosome.copy()
-    for i in range(len(chromosome)):
+    for i in range(len(new_chromosome)):
         if rand() < mutation_rate:
-            chromosome[i] += np.random.uniform(-1, 1)
-    return chromosome
+            new_chromosome[i] += np.random.uniform(-1, 1)
+    return new_chromosome
+
+
+def genome_length(architecture):
+    weights = sum(architecture[layer] * architecture[layer + 1] for layer in range(len(architecture) - 1))
+    biases = sum(architecture[1:])
+    return weights + biases
+
+
+def random_genomes(population, architecture):
+    """Returns a contiguous (population, genome length) float32 matrix with one flattened network per row."""
+    return np.random.uniform(-1, 1, (population, genome_length(architecture))).astype(np.float32)
+
+
+def tournament_selection_population(fitness, number_of_competitors=3, size=None):
+    """Runs size tournaments (one per individual by default) at once and returns the indices of the winners."""
+    return selection.tournament_selection(fitness, size, number_of_competitors)
+
+
+def crossover_population(parents, crossover_rate, method='single_point'):
+    """Crosses the consecutive pairs of rows (0 with 1, 2 with 3, ...) of the parents matrix and returns the children
+    matrix. With an odd number of rows the last parent is copied unchanged."""
+    children = parents.copy()
+    pairs = len(parents) // 2
+    parent_1 = parents[0:2 * pairs:2]
+    parent_2 = parents[1:2 * pairs:2]
+    length = parents.shape[1]
+
+    if method == 'single_point':
+        # select crossover points that are not on the end of the string
+        crossover_point = randint(1, length - 2, pairs)
+        swap = np.arange(length) >= crossover_point[:, None]
+    elif method == 'uniform':
+        swap = rand(pairs, length) < 0.5
+    else:
+        raise ValueError("Unknown crossover method '{}'".format(method))
+
+    # pairs that skip the crossover keep their genes
+    swap &= (rand(pairs) < crossover_rate)[:, None]
+    children[0:2 * pairs:2] = np.where(swap, parent_2, parent_1)
+    children[1:2 * pairs:2] = np.where(swap, parent_1, parent_2)
+    return children
+
+
+def mutate_population(genomes, mutation_rate, method='uniform', scale=1.0):
+    """Mutates the genomes matrix in place. Each gene mutates with probability mutation_rate by adding uniform noise
+    in [-scale, scale] or gaussian noise with standard deviation scale."""
+    mutated = rand(*genomes.shape) < mutation_rate
+    count = np.count_nonzero(mutated)
+    if method == 'uniform':
+        noise = np.random.uniform(-scale, scale, count)
+    elif method == 'gaussian':
+        noise = np.random.normal(0, scale, count)
+    else:
+        raise ValueError("Unknown mutation method '{}'".format(method))
+    genomes[mutated] += noise.astype(genomes.dtype)
+    return genomes
 
 
 def flatten_parameters(parameters, architecture):
@@ -48,6 +105,7 @@ def flatten_parameters(parameters, architecture):
 
 
 def reshape_parameters(vector, architecture):
+    # with a genome row as vector, the matrices are views into the genome matrix
     first = 0
     parameters = {}
 
@@ -74,29 +132,20 @@ def reshape_parameters(vector, architecture):
 
 if __name__ == "__main__":
 
-    from snake import Snake
+    import time
 
-    nn_architecture = (2, 4, 3)
-    snakes = [Snake(None, None, nn_architecture) for _ in range(2)]
+    nn_architecture = (6, 5, 4)
+    population = 10000
+    genomes = random_genomes(population, nn_architecture)
+    fitness_list = np.random.randint(-100, 1000, population)
 
-    crossover_rate = 0.0
-    mutation_rate = 0.0
-
-    parameters_list = [snake.brain.parameters for snake in snakes]
-    fitness_list = [1, 2]
-    mating_pool = [tournament_selection(parameters_list, fitness_list)
-                   for _ in range(len(parameters_list))]
-
-    parent_chromosomes = [flatten_parameters(brain, nn_architecture) for brain in mating_pool]
-    crossed_chromosomes = []
-    for pair in range(0, len(parent_chromosomes), 2):
-        for child in crossover(parent_chromosomes[pair], parent_chromosomes[pair + 1], crossover_rate):
-            child = mutation(child, mutation_rate)
-            crossed_chromosomes.append(child)
+    start = time.perf_counter()
+    mating_pool = genomes[tournament_selection_population(fitness_list)]
+    children = crossover_population(mating_pool, crossover_rate=0.7)
+    mutate_population(children, mutation_rate=0.1)
+    print('{} individuals | {} genes | {:.2f} ms'.format(
+        population, genome_length(nn_architecture), (time.perf_counter() - start) * 1000))
 
     # reshape parameters in the neural network architecture
-    new_parameters = []
-    for chromosome in crossed_chromosomes:
-        new_parameters.append(reshape_parameters(chromosome, nn_architecture))
-
-    print('done')
\ No newline at end of file
+    parameters = reshape_parameters(children[0], nn_architecture)
+    print(np.shares_memory(parameters['W1'], children))
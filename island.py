@@ -0,0 +1,135 @@
+import multiprocessing
+import queue
+import numpy as np
+from world import World
+
+TOPOLOGIES = ('ring', 'full')
+
+
+def get_neighbours(index, islands, topology):
+    if topology == 'ring':
+        return [(index + 1) % islands] if islands > 1 else []
+    if topology == 'full':
+        return [other for other in range(islands) if other != index]
+    raise ValueError("Unknown topology '{}'".format(topology))
+
+
+def run_island(index, settings, inbox, outboxes, results):
+    # an island that fails sends its exception instead of its result, for the parent to raise it
+    try:
+        results.put(evolve_island(index, settings, inbox, outboxes))
+    except Exception as error:
+        results.put(error)
+
+
+def evolve_island(index, settings, inbox, outboxes):
+    """Evolves one headless World in its own process and returns its result. Every migration_interval generations
+    the best genomes are sent to the neighbouring islands, and the migrants that arrived in the meantime replace the
+    worst individuals before the next generation is bred. Nothing waits for the other islands."""
+    np.random.seed(settings['seed'] + index)
+    world = World(population=settings['population'], headless=True, vision=settings['vision'])
+    world.mutation_rate = settings['mutation_rate']
+    world.crossover_rate = settings['crossover_rate']
+
+    # leftover migrants must not keep this process alive when the neighbours have already finished
+    for outbox in outboxes:
+        outbox.cancel_join_thread()
+
+    history = []
+    received = 0
+    for generation in range(settings['generations']):
+        world.run_generation_batched()
+        history.append((max(world.fitness_list), float(np.mean(world.fitness_list))))
+
+        if (generation + 1) % settings['migration_interval'] == 0:
+            genomes, fitness = world.get_best_individuals(settings['migrants'])
+            for outbox in outboxes:
+                outbox.put((genomes, fitness))
+
+            while True:
+                try:
+                    genomes, fitness = inbox.get_nowait()
+                except queue.Empty:
+                    break
+                world.replace_worst_individuals(genomes, fitness)
+                received += len(genomes)
+
+        if generation < settings['generations'] - 1:
+            world.create_next_generation()
+
+    best_genomes, best_fitness = world.get_best_individuals(1)
+    return {'island': index, 'best_genome': best_genomes[0], 'best_fitness': best_fitness[0], 'history': history,
+            'migrants_received': received}
+
+
+class IslandModel:
+    """"IslandModel evolves several sub-populations, each one in its own process with its own World, and lets them
+    exchange their best genomes every migration_interval generations over multiprocessing queues, in a ring or in a
+    fully connected topology. Islands never wait for each other, and each process only holds its own population."""
+    def __init__(self, islands=4, population=100, migration_interval=10, migrants=2, topology='ring', seed=0,
+                 vision=None, mutation_rate=0.1, crossover_rate=0.7):
+        if topology not in TOPOLOGIES:
+            raise ValueError("Unknown topology '{}'".format(topology))
+        if migration_interval < 1 or migrants < 1:
+            raise ValueError('migration_interval and migrants must be at least 1')
+        self.islands = islands
+        self.topology = topology
+        self.settings = {
+            'population': population,
+            'migration_interval': migration_interval,
+            'migrants': migrants,
+            'seed': seed,
+            'vision': vision,
+            'mutation_rate': mutation_rate,
+            'crossover_rate': crossover_rate,
+        }
+
+    def run(self, generations):
+        """Runs every island for the given number of generations and returns their results, sorted by island. If an
+        island fails, the others are stopped and its exception is raised."""
+        settings = dict(self.settings, generations=generations)
+        inboxes = [multiprocessing.Queue() for _ in range(self.islands)]
+        results = multiprocessing.Queue()
+
+        processes = []
+        for index in range(self.islands):
+            outboxes = [inboxes[neighbour] for neighbour in get_neighbours(index, self.islands, self.topology)]
+            process = multiprocessing.Process(target=run_island, args=(index, settings, inboxes[index], outboxes,
+                                                                       results))
+            process.start()
+            processes.append(process)
+
+        island_results = []
+        try:
+            while len(island_results) < len(processes):
+                try:
+                    result = results.get(timeout=0.5)
+                except queue.Empty:
+                    # a process killed before it could send anything
+                    for process in processes:
+                        if process.exitcode not in (None, 0):
+                            raise RuntimeError('An island process exited with code {}'.format(process.exitcode))
+                    continue
+                if isinstance(result, Exception):
+                    raise result
+                island_results.append(result)
+        except BaseException:
+            for process in processes:
+                process.terminate()
+            raise
+        finally:
+            for process in processes:
+                process.join()
+        return sorted(island_results, key=lambda result: result['island'])
+
+
+if __name__ == "__main__":
+
+    import time
+
+    model = IslandModel(islands=4, population=200, migration_interval=5, migrants=2, topology='ring')
+    start = time.perf_counter()
+    for result in model.run(generations=30):
+        print('Island #{} | Best fitness={} \t| Migrants received={}'.format(
+            result['island'], result['best_fitness'], result['migrants_received']))
+    print('{:.2f} s'.format(time.perf_counter() - start))
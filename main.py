@@ -1,9 +1,129 @@
+"""Command-line entry point for training runs.
+
+Trains a World until the last generation or the wall-clock budget is reached, printing generations/s, evaluations/s and
+game steps/s along the way (only steps actually played: cache hits and steps skipped in loops are not counted). The
+budget is checked before every generation, which is only started if it is expected to end in time. With --steady-state
+there is no generational barrier (see steady_state.SteadyState) and a generation is population evaluations. It always
+exits cleanly: on SIGTERM or Ctrl+C the current generation is finished first (a second signal drops it and keeps the
+checkpoint of the last complete one), and in every case the metrics and champion replays are written and the worker
+processes are stopped. Running it again with the same checkpoint directory resumes the run.
+
+    python main.py --population 500 --generations 500 --workers 4
+    python main.py --time-budget 3600 --checkpoint-dir runs/a/checkpoints --metrics-dir runs/a/metrics
+    python main.py --steady-state --workers 8
+"""
+import argparse
+import os
+import signal
+import time
+import numpy as np
+import checkpoint
+from metrics import MetricsLog
+from replay import load_replays, save_replays
+from steady_state import SteadyState
+from world import World
+
 # TODO: Visualization for Neural Network
 # TODO: Graphs of fitness evolution
 # TODO: Make possible to choose and display a selected individual
-# TODO: Add seed to random to replicate scenarios
-# TODO: Add body and wall vision to snake
-# TODO: add a save/load method for snakes
+
+
+def parse_arguments(arguments=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--population', type=int, default=500)
+    parser.add_argument('--generations', type=int, default=500, help='last generation number (also when resuming)')
+    parser.add_argument('--time-budget', type=float, default=None, help='wall-clock budget in seconds')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--elitism', type=int, default=10)
+    parser.add_argument('--cache-size', type=int, default=10000)
+    parser.add_argument('--trials', type=int, default=1, help='apple seeds per individual')
+    parser.add_argument('--checkpoint-dir', default='checkpoints')
+    parser.add_argument('--metrics-dir', default='metrics')
+    parser.add_argument('--replays', default='champions.rpl', help='file for the replay of every champion')
+    parser.add_argument('--steady-state', action='store_true', help='breed a child as soon as each evaluation ends')
+    parser.add_argument('--display', action='store_true', help='show the champions in a window (render thread)')
+    return parser.parse_args(arguments)
+
+
+def stop_on_signal(world):
+    # finish the current generation and exit cleanly; a second signal interrupts the generation
+    def stop(signal_number, frame):
+        if not world.running:
+            raise KeyboardInterrupt
+        print('Signal {} received, stopping after this generation'.format(signal_number))
+        world.running = False
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+
+def out_of_time(start, budget, last_duration):
+    # a generation is only started if it is expected to end within the budget
+    return budget is not None and time.perf_counter() - start + last_duration > budget
+
+
+def train(args):
+    np.random.seed(args.seed)
+    world = World(population=args.population, workers=args.workers, headless=not args.display,
+                  elitism=args.elitism, cache_size=args.cache_size, trials=args.trials, threaded_render=True,
+                  seed=args.seed)
+    champions = []
+    if checkpoint.has_checkpoint(args.checkpoint_dir):
+        world.load_checkpoint(args.checkpoint_dir)
+        print('Resuming from generation #{}'.format(world.generation_number))
+        # the champions of the run so far are kept in front of the new ones
+        if os.path.exists(args.replays):
+            champions = load_replays(args.replays)
+    steady_state = SteadyState(world) if args.steady_state else None
+    stop_on_signal(world)
+
+    metrics = MetricsLog(args.metrics_dir)
+    start = time.perf_counter()
+    last_duration = 0.0
+    generations = 0
+    steps = 0
+    evaluations = 0
+    interrupted = False
+    try:
+        while world.running and world.generation_number <= args.generations:
+            if out_of_time(start, args.time_budget, last_duration):
+                print('Time budget of {} s reached'.format(args.time_budget))
+                break
+
+            generation_start = time.perf_counter()
+            world.handle_events()
+            if steady_state is not None:
+                steady_state.run(world.population)
+            else:
+                world.run_generation_multicore()
+            steps += world.played_steps
+            world.print_generation_statistics()
+            metrics.log(world)
+            evaluations += len(world.fitness_list)
+            champions.append(world.best_replay)
+            if world.is_drawing():
+                world.draw_best_individual()
+            if steady_state is not None:
+                world.generation_number += 1
+            else:
+                world.create_next_generation()
+            world.save_checkpoint(args.checkpoint_dir)
+
+            last_duration = time.perf_counter() - generation_start
+            generations += 1
+            elapsed = time.perf_counter() - start
+            print('    {:.2f} gen/s | {:.0f} evals/s | {:.0f} steps/s | {:.0f} s elapsed'.format(
+                generations / elapsed, evaluations / elapsed, steps / elapsed, elapsed))
+    except KeyboardInterrupt:
+        # the checkpoint of the last complete generation is kept
+        print('Interrupted')
+        interrupted = True
+    finally:
+        metrics.close()
+        if champions:
+            save_replays(args.replays, champions)
+        world.close(terminate=interrupted)
+
 
 if __name__ == "__main__":
-    pass
\ No newline at end of file
+    train(parse_arguments())
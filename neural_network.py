@@ -42,6 +42,144 @@ class NeuralNetwork:
     def get_output(self):
         return self.outputs[-1]
 
+    def compile(self, quantize=False):
+        """Returns a CompiledNetwork with the same parameters, for fast single-input inference."""
+        return CompiledNetwork(self.architecture, self.parameters, quantize)
+
+
+class CompiledNetwork:
+    """"Inference-only version of a NeuralNetwork. The layers are compiled once into a fixed plan of contiguous
+    float32 weights and preallocated input and activation buffers, so feedforward (one input row, as in Snake) does
+    not build keys nor allocate arrays. The activations of every layer are kept in the buffers and only copied to
+    outputs when capture is asked for. With quantize, weights are stored as int8 with one scale per output and each
+    layer quantizes its input to the int8 range, accumulating in int32 (numpy has no int8 matrix product). Use
+    argmax_agreement to check a compiled network against the float64 one."""
+    def __init__(self, architecture, parameters, quantize=False):
+        self.architecture = tuple(architecture)
+        self.quantize = quantize
+        self.input = np.zeros(architecture[0], dtype=np.float32)
+        self.activations = [np.zeros(size, dtype=np.float32) for size in architecture[1:]]
+        self.outputs = []
+
+        self.weights = []
+        self.biases = []
+        self.scales = []
+        for layer in range(1, len(architecture)):
+            weights = np.asarray(parameters['W'+str(layer)], dtype=np.float64)
+            self.biases.append(np.ascontiguousarray(parameters['b'+str(layer)], dtype=np.float32).reshape(-1))
+            if quantize:
+                scales = np.abs(weights).max(axis=0) / 127
+                scales[scales == 0] = 1.0
+                self.weights.append(np.rint(weights / scales).astype(np.int8))
+                self.scales.append(scales.astype(np.float32))
+            else:
+                self.weights.append(np.ascontiguousarray(weights, dtype=np.float32))
+
+        if quantize:
+            # int32 copies of the int8 weights and buffers for the quantized inputs and the accumulators
+            self.int_weights = [weights.astype(np.int32) for weights in self.weights]
+            self.int_inputs = [np.zeros(size, dtype=np.int32) for size in architecture[:-1]]
+            self.accumulators = [np.zeros(size, dtype=np.int32) for size in architecture[1:]]
+            self.scaled_inputs = [np.zeros(size, dtype=np.float32) for size in architecture[:-1]]
+
+    def feedforward(self, x, capture=False):
+        self.input[...] = x
+        x = self.input
+        for layer, output in enumerate(self.activations):
+            if self.quantize:
+                self.quantized_dot(layer, x, output)
+            else:
+                np.dot(x, self.weights[layer], out=output)
+            np.add(output, self.biases[layer], out=output)
+            np.maximum(output, 0.0, out=output)
+            x = output
+
+        if capture:
+            self.outputs = [activation.copy() for activation in self.activations]
+        return x
+
+    def quantized_dot(self, layer, x, output):
+        # symmetric quantization of the input to [-127, 127]
+        scaled = self.scaled_inputs[layer]
+        scale = np.abs(x, out=scaled).max() / 127
+        if scale == 0:
+            output.fill(0.0)
+            return
+        np.multiply(x, 1 / scale, out=scaled)
+        np.rint(scaled, out=scaled)
+        np.copyto(self.int_inputs[layer], scaled, casting='unsafe')
+
+        np.dot(self.int_inputs[layer], self.int_weights[layer], out=self.accumulators[layer])
+        np.multiply(self.accumulators[layer], self.scales[layer], out=output)
+        np.multiply(output, scale, out=output)
+
+    def get_output(self):
+        return self.activations[-1]
+
+
+def argmax_agreement(network, compiled, inputs):
+    """Fraction of the inputs (one row each, e.g. recorded from games) on which a compiled network picks the same
+    output as the float64 network it was compiled from."""
+    agreements = [np.argmax(network.feedforward(x)) == np.argmax(compiled.feedforward(x)) for x in inputs]
+    return float(np.mean(agreements))
+
+
+class PopulationNetwork:
+    """"Holds the parameters of a whole population of networks that share the same architecture. Weights and biases
+    are stacked in (population, in, out) arrays, so the inputs of many individuals are evaluated in one batched call
+    instead of one feedforward per individual."""
+    def __init__(self, architecture, weights, biases):
+        self.architecture = architecture
+        self.weights = weights      # one (population, in, out) array per layer
+        self.biases = biases        # one (population, 1, out) array per layer
+        self.population = len(weights[0])
+
+    @classmethod
+    def from_networks(cls, networks):
+        architecture = networks[0].architecture
+        weights = []
+        biases = []
+        for layer in range(1, len(architecture)):
+            weights.append(np.stack([network.parameters['W'+str(layer)] for network in networks]))
+            biases.append(np.stack([network.parameters['b'+str(layer)] for network in networks]))
+        return cls(architecture, weights, biases)
+
+    @classmethod
+    def from_genomes(cls, genomes, architecture):
+        """Builds the stacked parameters from a (population, genome length) matrix of flattened parameters, laid out
+        as in genetic_algorithm.flatten_parameters (all weights first, then all biases)."""
+        population = len(genomes)
+        weights = []
+        biases = []
+        first = 0
+        for layer in range(len(architecture) - 1):
+            last = first + architecture[layer] * architecture[layer + 1]
+            weights.append(genomes[:, first:last].reshape(population, architecture[layer], architecture[layer + 1]))
+            first = last
+        for layer in range(len(architecture) - 1):
+            last = first + architecture[layer + 1]
+            biases.append(genomes[:, first:last].reshape(population, 1, architecture[layer + 1]))
+            first = last
+        return cls(architecture, weights, biases)
+
+    def feedforward(self, x, individuals=None):
+        """Evaluates one input row per individual. x has shape (n, in) and individuals holds the n population
+        indices the rows belong to (all individuals, in order, if None)."""
+        for weights, biases in zip(self.weights, self.biases):
+            if individuals is not None:
+                weights = weights[individuals]
+                biases = biases[individuals]
+            x = relu(np.einsum('ni,nio->no', x, weights) + biases[:, 0])
+        return x
+
+    def get_individual(self, index):
+        """Returns a NeuralNetwork whose parameters are views into the stacked arrays."""
+        parameters = {}
+        for layer in range(len(self.weights)):
+            parameters['W'+str(layer+1)] = self.weights[layer][index]
+            parameters['b'+str(layer+1)] = self.biases[layer][index]
+        return NeuralNetwork(self.architecture, parameters)
+
 
 if __name__ == "__main__":
     np.random.seed(2020)
@@ -56,3 +194,22 @@ if __name__ == "__main__":
     for y in nn.outputs:
         print('output:')
         print(y)
+
+    # compiled networks against the float64 one, on inputs recorded from games
+    from game import Game
+    import genetic_algorithm as ga
+
+    architecture = (6, 5, 4)
+    inputs = []
+    networks = []
+    for genome in ga.random_genomes(200, architecture):
+        game = Game(ga.reshape_parameters(genome, architecture), architecture=architecture)
+        while not game.game_over:
+            inputs.append(game.get_inputs())
+            game.play()
+        networks.append(NeuralNetwork(architecture, ga.reshape_parameters(np.asarray(genome, np.float64),
+                                                                          architecture)))
+    for quantize in (False, True):
+        agreement = np.mean([argmax_agreement(network, network.compile(quantize), inputs[:200])
+                             for network in networks])
+        print('quantize={}: argmax agreement {:.2%} on {} recorded inputs'.format(quantize, agreement, 200))
@@ -0,0 +1,129 @@
+import csv
+import functools
+import time
+from collections import defaultdict
+import genetic_algorithm as ga
+import selection
+
+SIMULATION_METHODS = ('run_generation', 'run_generation_batched', 'run_generation_multicore',
+                      'run_generation_parallel', 'run_generation_sequential', 'run_generation_published')
+GA_FUNCTIONS = {
+    'crossover_population': 'crossover',
+    'mutate_population': 'mutation',
+    'reshape_parameters': 'reshaping',
+}
+APP_METHODS = ('draw_background', 'draw_games', 'draw_batch', 'show')
+PHASES = ('simulation', 'selection', 'crossover', 'mutation', 'reshaping', 'game_construction', 'next_generation',
+          'rendering')
+
+
+class PhaseProfiler:
+    """"PhaseProfiler times the phases of every generation of a World: simulation, selection, crossover, mutation,
+    reshaping, Game construction and rendering. attach wraps the world's methods, its App's drawing methods and the
+    genetic algorithm operators in place, so call sites do not change and nothing is timed (nor slowed down) while the
+    profiler is detached. Times are exclusive: a phase nested in another one is not counted twice."""
+    def __init__(self):
+        self.rows = []
+        self.times = defaultdict(float)
+        self.stack = []
+        self.patches = []
+
+    def attach(self, world):
+        for name in SIMULATION_METHODS:
+            self.patch(world, name, 'simulation')
+        self.patch(world, 'create_games', 'game_construction')
+        self.patch(world, 'draw_best_individual', 'rendering')
+        for name, phase in GA_FUNCTIONS.items():
+            self.patch(ga, name, phase)
+        self.patch(selection, 'select', 'selection')
+        if world.app is not None:
+            for name in APP_METHODS:
+                self.patch(world.app, name, 'rendering')
+
+        # the end of create_next_generation closes the row of the generation
+        create_next_generation = world.create_next_generation
+        timed = self.wrap('next_generation', create_next_generation)
+
+        @functools.wraps(create_next_generation)
+        def create_next_generation_and_log(*args, **kwargs):
+            generation_number = world.generation_number
+            result = timed(*args, **kwargs)
+            self.end_generation(world, generation_number)
+            return result
+
+        self.patches.append((world, 'create_next_generation', world.__dict__.get('create_next_generation')))
+        world.create_next_generation = create_next_generation_and_log
+
+    def detach(self):
+        for owner, name, original in reversed(self.patches):
+            if original is None:
+                delattr(owner, name)
+            else:
+                setattr(owner, name, original)
+        self.patches = []
+
+    def patch(self, owner, name, phase):
+        # instances get a wrapper that shadows the class method, modules get their function replaced
+        self.patches.append((owner, name, getattr(owner, '__dict__', {}).get(name)))
+        setattr(owner, name, self.wrap(phase, getattr(owner, name)))
+
+    def wrap(self, phase, function):
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            self.stack.append(0.0)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                children = self.stack.pop()
+                self.times[phase] += elapsed - children
+                if self.stack:
+                    self.stack[-1] += elapsed
+        return timed
+
+    def end_generation(self, world, generation_number):
+        row = {'generation': generation_number}
+        for phase in PHASES:
+            row[phase] = self.times[phase]
+        row['total'] = sum(self.times.values())
+        row['games'] = len(world.steps_list)
+        row['steps'] = sum(world.steps_list)
+        row['steps_per_game'] = row['steps'] / row['games'] if row['games'] else 0.0
+        self.rows.append(row)
+        self.times = defaultdict(float)
+
+    def dump(self, path):
+        """Writes the per-generation breakdown (seconds per phase and steps per game) as CSV."""
+        with open(path, 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=list(self.rows[0]) if self.rows else ['generation'])
+            writer.writeheader()
+            writer.writerows(self.rows)
+
+    def print_summary(self):
+        total = sum(row['total'] for row in self.rows)
+        print('Profile of {} generations | {:.3f} s'.format(len(self.rows), total))
+        for phase in PHASES:
+            seconds = sum(row[phase] for row in self.rows)
+            print('{:>20}: {:8.3f} s {:6.1%}'.format(phase, seconds, seconds / total if total else 0.0))
+        steps = sum(row['steps'] for row in self.rows)
+        games = sum(row['games'] for row in self.rows)
+        print('{:>20}: {:8.1f}'.format('steps per game', steps / games if games else 0.0))
+
+
+if __name__ == "__main__":
+
+    import numpy as np
+    from world import World
+
+    np.random.seed(0)
+    world = World(population=500, headless=True)
+    profiler = PhaseProfiler()
+    profiler.attach(world)
+
+    for _ in range(20):
+        world.run_generation_batched()
+        world.create_next_generation()
+
+    profiler.detach()
+    profiler.print_summary()
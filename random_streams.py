@@ -0,0 +1,50 @@
+import numpy as np
+
+# uniforms pre-generated per game; the first two place the initial apple and each eaten apple uses one more
+SPAWN_BLOCK = 32
+
+GOLDEN = np.uint64(0x9e3779b97f4a7c15)
+MIX_1 = np.uint64(0xbf58476d1ce4e5b9)
+MIX_2 = np.uint64(0x94d049bb133111eb)
+
+
+def mix64(x):
+    """The splitmix64 finalizer: a bijective hash of an array of uint64 values."""
+    x = np.array(x, dtype=np.uint64, ndmin=1)
+    x = (x ^ (x >> np.uint64(30))) * MIX_1
+    x = (x ^ (x >> np.uint64(27))) * MIX_2
+    return x ^ (x >> np.uint64(31))
+
+
+def derive_keys(keys, values):
+    """Keys of the child streams numbered by values (broadcast against keys)."""
+    return mix64(np.asarray(keys, dtype=np.uint64) ^ mix64(np.asarray(values, dtype=np.uint64) + GOLDEN))
+
+
+def get_game_keys(run_seed, generation, individuals):
+    """Keys of the games of the given individuals (an array of indices) of a generation: a game depends only on
+    them, not on how many games were created before it nor in which order."""
+    return derive_keys(derive_keys(mix64(run_seed), generation), individuals)
+
+
+def get_uniforms(keys, start, count):
+    """Returns a (len(keys), count) array with the uniforms in [0, 1) at positions start to start + count of the
+    stream of every key. Streams are counter-based (value i is the hash of the key and i, as in splitmix64), so any
+    block of any stream is computed directly, for all keys at once."""
+    keys = np.array(keys, dtype=np.uint64, ndmin=1)
+    counters = np.arange(start + 1, start + count + 1, dtype=np.uint64)
+    bits = mix64(keys[:, None] + counters * GOLDEN)
+    return (bits >> np.uint64(11)) * (1.0 / (1 << 53))
+
+
+if __name__ == "__main__":
+
+    import time
+
+    keys = get_game_keys(0, 1, np.arange(100000))
+    start = time.perf_counter()
+    block = get_uniforms(keys, 0, SPAWN_BLOCK)
+    print('{} games x {} uniforms | {:.1f} ms | mean {:.4f}'.format(
+        len(keys), SPAWN_BLOCK, (time.perf_counter() - start) * 1e3, block.mean()))
+    # a single game computes the same block on its own
+    print((get_uniforms(keys[12345], 0, SPAWN_BLOCK)[0] == block[12345]).all())
@@ -0,0 +1,321 @@
+import threading
+import time
+import numpy as np
+import pygame
+from pygame import locals
+from board_config import BOARD_SIZE, BLOCK_SIZE, BACKGROUND_COLOR
+
+WINDOW_SIZE = (BOARD_SIZE[0] * BLOCK_SIZE, BOARD_SIZE[1] * BLOCK_SIZE)
+GRID_COLOR = (200, 200, 200)
+HEAD_COLOR = (0, 255, 0)
+APPLE_COLOR = (255, 0, 0)
+REPLAY_COLOR = (0, 0, 255)      # snake of replayed games
+EMPTY = -1
+
+
+def draw_snake(surface, snake):
+    # draw tail:
+    for i in range(1, snake.length):
+        x, y = snake.get_segment(i)
+        block = pygame.Rect(x * BLOCK_SIZE, y * BLOCK_SIZE, BLOCK_SIZE, BLOCK_SIZE)
+        pygame.draw.rect(surface, snake.color, block)
+        pygame.draw.rect(surface, (0, 0, 0), block, 2)
+
+    # draw head:
+    block = pygame.Rect(snake.head_x * BLOCK_SIZE, snake.head_y * BLOCK_SIZE, BLOCK_SIZE, BLOCK_SIZE)
+    pygame.draw.rect(surface, (0, 255, 0), block)
+    pygame.draw.rect(surface, (0, 0, 0), block, 2)
+
+
+def draw_apple(surface, apple):
+    block = pygame.Rect(apple.x * BLOCK_SIZE, apple.y * BLOCK_SIZE, BLOCK_SIZE, BLOCK_SIZE)
+    pygame.draw.rect(surface, (255, 0, 0), block)
+    pygame.draw.rect(surface, (0, 0, 0), block, 2)
+
+
+def draw_game(surface, game):
+    draw_snake(surface, game.snake)
+    draw_apple(surface, game.apple)
+
+
+def pack_color(color):
+    red, green, blue = color
+    return (red << 16) | (green << 8) | blue
+
+
+def unpack_color(packed):
+    return (packed >> 16) & 255, (packed >> 8) & 255, packed & 255
+
+
+def render_background():
+    background = pygame.Surface(WINDOW_SIZE)
+    background.fill(BACKGROUND_COLOR)
+    for column in range(1, BOARD_SIZE[0]):
+        x = column * BLOCK_SIZE
+        pygame.draw.line(background, color=GRID_COLOR, start_pos=(x, 0), end_pos=(x, WINDOW_SIZE[1]))
+
+    for row in range(1, BOARD_SIZE[1]):
+        y = row * BLOCK_SIZE
+        pygame.draw.line(background, color=GRID_COLOR, start_pos=(0, y), end_pos=(WINDOW_SIZE[0], y))
+    return background
+
+
+def get_game_cells(game):
+    """Returns the cells of a game and their packed colors, in drawing order (tail, head, apple)."""
+    snake = game.snake
+    x = snake.x[1:] + [snake.head_x, game.apple.x]
+    y = snake.y[1:] + [snake.head_y, game.apple.y]
+    colors = [pack_color(snake.color)] * (snake.length - 1) + [pack_color(HEAD_COLOR), pack_color(APPLE_COLOR)]
+    return x, y, colors
+
+
+def get_batch_cells(batch, games, colors):
+    """Returns the cells of the given games of a BatchGame and their packed colors, as get_game_cells; colors is a
+    (games, 3) array with the body color of each of those games."""
+    games = np.asarray(games)
+    segments = (batch.head[games, None] + np.arange(1, batch.length)) % batch.capacity
+    tail_x = batch.body_x[games[:, None], segments].ravel()
+    tail_y = batch.body_y[games[:, None], segments].ravel()
+    colors = np.asarray(colors, dtype=np.int64).reshape(-1, 3)
+    tail_colors = np.repeat((colors[:, 0] << 16) | (colors[:, 1] << 8) | colors[:, 2], batch.length - 1)
+
+    # heads and apples are drawn on top of the bodies
+    x = np.concatenate((tail_x, batch.head_x[games], batch.apple_x[games]))
+    y = np.concatenate((tail_y, batch.head_y[games], batch.apple_y[games]))
+    colors = np.concatenate((tail_colors, np.full(len(games), pack_color(HEAD_COLOR)),
+                             np.full(len(games), pack_color(APPLE_COLOR))))
+    return x, y, colors
+
+
+class BoardView:
+    """"BoardView draws frames of the board as arrays of colored cells. The background with the grid is rendered
+    once. When few cells changed since the previous frame only those are redrawn; otherwise the whole board is blitted
+    from a numpy array with one pixel per cell, scaled up by pygame, so the cost of a frame barely depends on the
+    number of snakes shown."""
+    def __init__(self, surface, full_redraw_fraction=0.1):
+        self.surface = surface
+        self.background = render_background()
+        self.full_redraw_cells = int(full_redraw_fraction * BOARD_SIZE[0] * BOARD_SIZE[1])
+
+        # full redraws scale surfaces with one pixel per cell up to the window: the colors of the cells (black cells
+        # are transparent, so the background shows through) and the occupied cells, which are multiplied by a mask
+        # of the 2 px border of every block and subtracted to draw the black borders
+        self.cell_surface = pygame.Surface(BOARD_SIZE)
+        self.cell_layer = pygame.Surface(WINDOW_SIZE)
+        self.cell_layer.set_colorkey((0, 0, 0))
+        self.border_layer = pygame.Surface(WINDOW_SIZE)
+        self.border_mask = pygame.Surface(WINDOW_SIZE)
+        for column in range(BOARD_SIZE[0]):
+            for row in range(BOARD_SIZE[1]):
+                block = pygame.Rect(column * BLOCK_SIZE, row * BLOCK_SIZE, BLOCK_SIZE, BLOCK_SIZE)
+                pygame.draw.rect(self.border_mask, (255, 255, 255), block, 2)
+
+        self.cells = np.full(BOARD_SIZE, EMPTY, dtype=np.int64)
+        self.dirty_rects = []
+        self.clear()
+
+    def clear(self):
+        self.surface.blit(self.background, (0, 0))
+        self.cells[:] = EMPTY
+        self.dirty_rects = [self.surface.get_rect()]
+
+    def draw_cells(self, x, y, colors):
+        """Draws a frame with the given cells (arrays of positions and packed colors); later cells are drawn on top
+        of earlier ones. Cells out of the board are ignored."""
+        x = np.asarray(x, dtype=np.int64)
+        y = np.asarray(y, dtype=np.int64)
+        colors = np.asarray(colors, dtype=np.int64)
+        inside = (x >= 0) & (x < BOARD_SIZE[0]) & (y >= 0) & (y < BOARD_SIZE[1])
+
+        frame = np.full(BOARD_SIZE, EMPTY, dtype=np.int64)
+        frame[x[inside], y[inside]] = colors[inside]
+
+        changed = np.argwhere(frame != self.cells)
+        if len(changed) > self.full_redraw_cells:
+            self.blit_pixels(frame)
+        else:
+            for cell_x, cell_y in changed:
+                block = pygame.Rect(cell_x * BLOCK_SIZE, cell_y * BLOCK_SIZE, BLOCK_SIZE, BLOCK_SIZE)
+                color = frame[cell_x, cell_y]
+                if color == EMPTY:
+                    self.surface.blit(self.background, block, block)
+                else:
+                    self.surface.fill(unpack_color(color), block)
+                    pygame.draw.rect(self.surface, (0, 0, 0), block, 2)
+                self.dirty_rects.append(block)
+        self.cells = frame
+
+    def blit_pixels(self, frame):
+        occupied = frame != EMPTY
+        colors = np.stack(unpack_color(frame), axis=-1)
+        # black is the transparent color, so black cells are drawn almost black
+        colors[occupied & (frame == 0), 2] = 1
+        colors[~occupied] = 0
+        pygame.surfarray.blit_array(self.cell_surface, colors)
+        pygame.transform.scale(self.cell_surface, WINDOW_SIZE, self.cell_layer)
+
+        pygame.surfarray.blit_array(self.cell_surface, np.repeat(occupied[..., None] * 255, 3, axis=-1))
+        pygame.transform.scale(self.cell_surface, WINDOW_SIZE, self.border_layer)
+        self.border_layer.blit(self.border_mask, (0, 0), special_flags=pygame.BLEND_RGB_MULT)
+
+        self.surface.blit(self.background, (0, 0))
+        self.surface.blit(self.cell_layer, (0, 0))
+        self.surface.blit(self.border_layer, (0, 0), special_flags=pygame.BLEND_RGB_SUB)
+        self.dirty_rects = [self.surface.get_rect()]
+
+    def draw_games(self, games):
+        x = []
+        y = []
+        colors = []
+        for game in games:
+            game_x, game_y, game_colors = get_game_cells(game)
+            x += game_x
+            y += game_y
+            colors += game_colors
+        self.draw_cells(x, y, colors)
+
+    def draw_batch(self, batch, games, colors):
+        """Draws the given games of a BatchGame straight from its arrays; colors is a (games, 3) array with the body
+        color of each of those games."""
+        self.draw_cells(*get_batch_cells(batch, games, colors))
+
+    def pop_dirty_rects(self):
+        dirty_rects, self.dirty_rects = self.dirty_rects, []
+        return dirty_rects
+
+
+class App:
+    """"App is the optional pygame front end of a World. It owns the window, draws games and maps the keyboard
+    controls to the world (Esc quits, Enter pauses, D toggles drawing, W/A change the mutation rate and 1/2/3 the
+    delay). It is only imported when visualization is requested."""
+    def __init__(self, world):
+        pygame.init()
+        self.surface = pygame.display.set_mode(WINDOW_SIZE)
+        self.view = BoardView(self.surface)
+        self.world = world
+        self.paused = False
+        self.delay = 0.01
+        self.draw_enabled = True
+
+    def draw_background(self):
+        self.view.clear()
+
+    def draw_games(self, games):
+        self.view.draw_games(games)
+
+    def draw_batch(self, batch, games, colors):
+        self.view.draw_batch(batch, games, colors)
+
+    def handle_events(self):
+        for event in pygame.event.get():
+            if event.type == locals.KEYDOWN:
+                # Esc --> Quit game
+                if event.key == locals.K_ESCAPE:
+                    self.world.running = False
+                # Enter --> Pause
+                elif event.key == locals.K_RETURN:
+                    self.paused = not self.paused
+                elif event.key == locals.K_d:
+                    self.draw_enabled = not self.draw_enabled
+                elif event.key == locals.K_w:
+                    self.world.mutation_rate += 0.1
+                    print("mutation_rate = {}".format(self.world.mutation_rate))
+                elif event.key == locals.K_a:
+                    self.world.mutation_rate -= 0.1
+                    print("mutation_rate = {}".format(self.world.mutation_rate))
+                elif event.key == locals.K_1:
+                    self.delay = 0.01
+                elif event.key == locals.K_2:
+                    self.delay = 0.1
+                elif event.key == locals.K_3:
+                    self.delay = 0
+            elif event.type == locals.QUIT:
+                self.world.running = False
+
+    def show(self):
+        time.sleep(self.delay)
+        # only the cells that changed are sent to the display
+        pygame.display.update(self.view.pop_dirty_rects())
+
+
+class RenderThread(threading.Thread):
+    """"RenderThread draws a World from its own thread, so a visible world trains as fast as a headless one. The
+    training thread publishes snapshots (the cells of the games being played, or the replay of the best game) and
+    never waits for the window: only the latest snapshot is kept, and the ones the render loop had no time for are
+    dropped. The window and the keyboard controls of the App belong to this thread; the delay keys set its frame
+    rate and pausing blocks the training thread on an event until it is resumed."""
+    def __init__(self, world):
+        super().__init__(daemon=True)
+        self.world = world
+        self.app = None
+        self.lock = threading.Lock()
+        self.frame = None
+        self.replay = None
+        self.replay_steps = None
+        self.ready = threading.Event()
+        self.error = None
+        self.resumed = threading.Event()
+        self.resumed.set()
+
+        from game import Game
+        self.replay_game = Game(parameters={}, vision=world.vision, seed=0, color=REPLAY_COLOR)
+
+    def run(self):
+        # an App that can not be created (no display) is raised by start in the training thread, which must not wait
+        # forever; pygame.quit gives the signal handlers back to Python
+        try:
+            self.app = App(self.world)
+        except Exception as error:
+            self.error = error
+            pygame.quit()
+            return
+        finally:
+            self.ready.set()
+        clock = pygame.time.Clock()
+        while self.world.running:
+            self.app.handle_events()
+            if self.app.paused:
+                self.resumed.clear()
+            else:
+                self.resumed.set()
+
+            with self.lock:
+                frame, self.frame = self.frame, None
+                replay, self.replay = self.replay, None
+            if replay is not None:
+                self.replay_steps = replay.play(self.replay_game)
+
+            if self.app.draw_enabled and not self.app.paused:
+                if frame is not None:
+                    self.app.view.draw_cells(*frame)
+                elif self.replay_steps is not None and next(self.replay_steps, None) is not None:
+                    self.app.draw_games([self.replay_game])
+            pygame.display.update(self.app.view.pop_dirty_rects())
+            clock.tick(1 / self.app.delay if self.app.delay > 0 else 0)
+
+        self.resumed.set()
+        pygame.quit()
+
+    def start(self):
+        super().start()
+        self.ready.wait()
+        if self.error is not None:
+            raise self.error
+
+    def is_drawing(self):
+        return self.app.draw_enabled
+
+    def wants_frame(self):
+        # a new frame is only worth building once the render loop has taken the previous one
+        return self.frame is None and self.app.draw_enabled
+
+    def publish_frame(self, x, y, colors):
+        with self.lock:
+            self.frame = (x, y, colors)
+
+    def publish_replay(self, replay):
+        with self.lock:
+            self.replay = replay
+
+    def wait_if_paused(self):
+        self.resumed.wait()
@@ -0,0 +1,94 @@
+import struct
+from board_config import BOARD_SIZE
+
+MAGIC = b'SNKR'
+VERSION = 1
+FILE_HEADER = struct.Struct('<4sHI')        # magic, version, number of replays
+REPLAY_HEADER = struct.Struct('<QqHHI')     # seed, fitness, board width, board height, number of actions
+
+
+class Replay:
+    """"A replay is all that is needed to show a game again without its neural network: the apple seed of the game
+    and the direction index (into Snake.directions) chosen at every step, one byte per step."""
+    def __init__(self, seed, actions, fitness=0, board_size=BOARD_SIZE):
+        self.seed = int(seed)
+        self.actions = bytes(actions)
+        self.fitness = int(fitness)
+        self.board_size = tuple(board_size)
+
+    def __str__(self):
+        return "Replay seed={}\t steps={}\t f={}".format(self.seed, len(self.actions), self.fitness)
+
+    def play(self, game):
+        """Plays the recorded actions on game (restarted with the replay's seed), yielding the game after each step."""
+        if self.board_size != BOARD_SIZE:
+            raise ValueError("Replay was recorded on a {}x{} board".format(*self.board_size))
+        game.seed = self.seed
+        game.reset()
+        for action in self.actions:
+            game.play(action)
+            yield game
+
+
+def save_replays(path, replays):
+    with open(path, 'wb') as file:
+        file.write(FILE_HEADER.pack(MAGIC, VERSION, len(replays)))
+        for replay in replays:
+            file.write(REPLAY_HEADER.pack(replay.seed, replay.fitness, replay.board_size[0], replay.board_size[1],
+                                          len(replay.actions)))
+            file.write(replay.actions)
+
+
+def load_replays(path):
+    with open(path, 'rb') as file:
+        data = file.read()
+
+    magic, version, count = FILE_HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("{} is not a replay file".format(path))
+
+    replays = []
+    offset = FILE_HEADER.size
+    for _ in range(count):
+        seed, fitness, width, height, length = REPLAY_HEADER.unpack_from(data, offset)
+        offset += REPLAY_HEADER.size
+        replays.append(Replay(seed, data[offset:offset + length], fitness, (width, height)))
+        offset += length
+    return replays
+
+
+if __name__ == "__main__":
+
+    import sys
+    import time
+    import pygame
+    from pygame import locals
+    from board_config import BLOCK_SIZE, BACKGROUND_COLOR
+    from game import Game
+    from render import draw_game
+
+    replays = load_replays(sys.argv[1])
+    selected = [replays[int(index)] for index in sys.argv[2:]] or replays
+
+    pygame.init()
+    surface = pygame.display.set_mode((BOARD_SIZE[0] * BLOCK_SIZE, BOARD_SIZE[1] * BLOCK_SIZE))
+
+    # the network of the game is never evaluated
+    game = Game(parameters={}, seed=0)
+
+    running = True
+    for replay in selected:
+        print(replay)
+        for _ in replay.play(game):
+            for event in pygame.event.get():
+                if event.type == locals.QUIT or (event.type == locals.KEYDOWN and event.key == locals.K_ESCAPE):
+                    running = False
+            if not running:
+                break
+            surface.fill(BACKGROUND_COLOR)
+            draw_game(surface, game)
+            pygame.display.flip()
+            time.sleep(0.05)
+        print('replayed fitness = {}'.format(game.snake.fitness))
+        if not running:
+            break
@@ -0,0 +1,82 @@
+import numpy as np
+from numpy.random import randint, rand, permutation
+
+# every method takes the fitness of the population and the number of parents to select, and returns their indices
+METHODS = ('tournament', 'rank', 'sus')
+
+
+def tournament_selection(fitness, size=None, tournament_size=3):
+    """Runs size tournaments (one per individual by default) of tournament_size random competitors at once and
+    returns the indices of the winners."""
+    fitness = np.asarray(fitness)
+    if size is None:
+        size = len(fitness)
+    competitors = randint(0, len(fitness), (size, tournament_size))
+    # the first competitor wins ties, as in genetic_algorithm.tournament_selection
+    winners = np.argmax(fitness[competitors], axis=1)
+    return competitors[np.arange(size), winners]
+
+
+def get_rank_probabilities(fitness, pressure=1.5):
+    # linear ranking: the worst individual is chosen with probability (2 - pressure) / n and the best one with
+    # pressure / n; equal fitness keeps the population order
+    population = len(fitness)
+    if population == 1:
+        return np.ones(1)
+    ranks = np.empty(population)
+    ranks[np.argsort(fitness, kind='stable')] = np.arange(population)
+    return (2 - pressure) / population + 2 * ranks * (pressure - 1) / (population * (population - 1))
+
+
+def rank_selection(fitness, size=None, pressure=1.5):
+    """Linear rank selection: samples size parents (one per individual by default) with probabilities that grow
+    linearly with their rank, from (2 - pressure) / n for the worst to pressure / n for the best (1 <= pressure
+    <= 2), so the scale of the fitness does not matter."""
+    fitness = np.asarray(fitness)
+    if size is None:
+        size = len(fitness)
+    cumulative = np.cumsum(get_rank_probabilities(fitness, pressure))
+    indices = np.searchsorted(cumulative, rand(size) * cumulative[-1], side='right')
+    return np.minimum(indices, len(fitness) - 1)
+
+
+def stochastic_universal_sampling(fitness, size=None):
+    """Stochastic universal sampling: size equally spaced pointers (one per individual by default) with a single
+    random offset over the fitness wheel, so every individual gets within one of its expected number of copies.
+    Fitness is shifted to start at 0 (it can be negative); if all individuals are equal they are equally likely.
+    The parents are returned shuffled, as crossover pairs consecutive rows."""
+    fitness = np.asarray(fitness, dtype=np.float64)
+    if size is None:
+        size = len(fitness)
+    weights = fitness - fitness.min()
+    if weights.sum() == 0:
+        weights = np.ones(len(fitness))
+    cumulative = np.cumsum(weights)
+    pointers = (rand() + np.arange(size)) * (cumulative[-1] / size)
+    indices = np.minimum(np.searchsorted(cumulative, pointers, side='right'), len(fitness) - 1)
+    return indices[permutation(size)]
+
+
+def select(fitness, size=None, method='tournament', **kwargs):
+    """Returns the indices of size parents chosen with one of METHODS; kwargs go to the selection function."""
+    if method == 'tournament':
+        return tournament_selection(fitness, size, **kwargs)
+    if method == 'rank':
+        return rank_selection(fitness, size, **kwargs)
+    if method == 'sus':
+        return stochastic_universal_sampling(fitness, size)
+    raise ValueError("Unknown selection method '{}'".format(method))
+
+
+if __name__ == "__main__":
+
+    import time
+
+    np.random.seed(0)
+    fitness = np.random.randint(-100, 1000, 100000)
+    for method in METHODS:
+        start = time.perf_counter()
+        parents = select(fitness, method=method)
+        elapsed = time.perf_counter() - start
+        print('{:>10} | {:.2f} ms | mean fitness of parents {:.1f} (population {:.1f})'.format(
+            method, elapsed * 1e3, fitness[parents].mean(), fitness.mean()))
@@ -1,21 +1,36 @@
-import pygame
 import numpy as np
 from numpy import random
-from board_config import BOARD_SIZE, BLOCK_SIZE
+from board_config import BOARD_SIZE
 from neural_network import NeuralNetwork
 
 
 class Snake:
     """"Snake class defines the snake movement logic and includes a neural network to calculate the next movement
-    based on inputs. It also defines drawing methods."""
-    def __init__(self, parent_screen, parameters, architecture=(6, 5, 4), initial_pos=(0, 0)):
-        self.surface = parent_screen
+    based on inputs. Drawing is done by the render module. Snakes are reset in place (with new parameters for their
+    brain) so the same objects, and their body buffers and grid, can be reused from one game to the next."""
+    __slots__ = ('brain', 'color', 'capacity', 'body_x', 'body_y', 'head', 'length', 'head_x', 'head_y', 'grid',
+                 'movements', 'directions', 'current_direction_index', 'current_direction', 'energy', 'fitness',
+                 'steps', 'apples')
+
+    def __init__(self, parameters, architecture=(6, 5, 4), initial_pos=(0, 0), color=None):
         self.brain = NeuralNetwork(architecture, parameters)
+        if color is None:
+            color = random.randint(0, 255, 3)
+        self.color = tuple(int(channel) for channel in color)
+
+        # the body is a ring buffer: segment i (0 is the head) is stored at index (head + i) % capacity
+        self.capacity = BOARD_SIZE[0] * BOARD_SIZE[1] + 1
+        self.body_x = [0] * self.capacity
+        self.body_y = [0] * self.capacity
+        self.head = 0
         self.length = 3
-        self.color = tuple(random.randint(0, 255, (1, 3)))
+        self.head_x = initial_pos[0]
+        self.head_y = initial_pos[1]
 
-        self.x = [initial_pos[0]] * self.length
-        self.y = [initial_pos[1]] * self.length
+        # occupancy grid: number of body segments on each cell, with a border of one cell around the board for a
+        # head that leaves the board
+        self.grid = np.zeros((BOARD_SIZE[0] + 2, BOARD_SIZE[1] + 2), dtype=np.int16)
+        self.place(initial_pos)
 
         self.movements = (-1, 0, 1)        # movements = ('turn left', 'go straight', 'turn right')
         self.directions = ('up', 'right', 'down', 'left')
@@ -25,61 +40,99 @@ class Snake:
         self.energy = 60
         self.fitness = 0
         self.steps = 0
+        self.apples = 0
 
     def __str__(self):
         return "Snake pos=({},{})\t e={}\t f={}\t d={}\t   out={}\t ".format(
-            self.x[0], self.y[0], self.energy, self.fitness, self.current_direction, self.brain.get_output())
-
-    def reset(self, initial_pos):
+            self.head_x, self.head_y, self.energy, self.fitness, self.current_direction, self.brain.get_output())
+
+    @property
+    def x(self):
+        return [self.body_x[(self.head + i) % self.capacity] for i in range(self.length)]
+
+    @property
+    def y(self):
+        return [self.body_y[(self.head + i) % self.capacity] for i in range(self.length)]
+
+    def place(self, initial_pos):
+        self.grid[:] = 0
+        self.head = 0
+        for i in range(self.length):
+            self.body_x[i] = initial_pos[0]
+            self.body_y[i] = initial_pos[1]
+        self.head_x = initial_pos[0]
+        self.head_y = initial_pos[1]
+        self.grid[initial_pos[0] + 1, initial_pos[1] + 1] = self.length
+
+    def reset(self, initial_pos, parameters=None):
+        if parameters is not None:
+            self.brain.parameters = parameters
         self.length = 3
-        self.x = [initial_pos[0]] * self.length
-        self.y = [initial_pos[1]] * self.length
+        self.place(initial_pos)
         self.current_direction_index = 1
         self.current_direction = self.directions[self.current_direction_index]
         self.energy = 60
         self.fitness = 0
         self.steps = 0
+        self.apples = 0
+
+    def get_segment(self, i):
+        index = (self.head + i) % self.capacity
+        return self.body_x[index], self.body_y[index]
 
-    def draw(self):
-        # draw tail:
-        for i in range(1, self.length):
-            block = pygame.Rect(self.x[i] * BLOCK_SIZE, self.y[i] * BLOCK_SIZE, BLOCK_SIZE, BLOCK_SIZE)
-            pygame.draw.rect(self.surface, self.color, block)
-            pygame.draw.rect(self.surface, (0, 0, 0), block, 2)
+    def is_occupied(self, x, y):
+        return self.grid[x + 1, y + 1] > 0
 
-        # draw head:
-        block = pygame.Rect(self.x[0] * BLOCK_SIZE, self.y[0] * BLOCK_SIZE, BLOCK_SIZE, BLOCK_SIZE)
-        pygame.draw.rect(self.surface, (0, 255, 0), block)
-        pygame.draw.rect(self.surface, (0, 0, 0), block, 2)
+    def get_free_cells(self):
+        """Returns the flat indices (x * BOARD_SIZE[1] + y) of the board cells without body segments."""
+        return np.flatnonzero(self.grid[1:-1, 1:-1] == 0)
+
+    def collides_with_itself(self):
+        # the head and the two segments after it can not be hit, as in a scan of segments 3 to length - 1
+        others = self.grid[self.head_x + 1, self.head_y + 1] - 1
+        if self.length > 2 and self.get_segment(2) == (self.head_x, self.head_y):
+            others -= 1
+        return others > 0
 
     def process_inputs(self, inputs):
         output = self.brain.feedforward(inputs)
-        maximum_index = int(np.argmax(output))
-        self.current_direction = self.directions[maximum_index]
+        self.set_direction(int(np.argmax(output)))
+
+    def set_direction(self, direction_index):
+        self.current_direction_index = direction_index
+        self.current_direction = self.directions[direction_index]
 
     def move(self):
-        # update snake's body from tail to head (head excluded)
-        for i in reversed(range(1, self.length)):
-            self.x[i] = self.x[i - 1]
-            self.y[i] = self.y[i - 1]
+        # free the tail cell and write the new head in its place
+        tail = (self.head + self.length - 1) % self.capacity
+        self.grid[self.body_x[tail] + 1, self.body_y[tail] + 1] -= 1
 
         # update snake's head
         if self.current_direction == 'up':
-            self.y[0] -= 1
+            self.head_y -= 1
         elif self.current_direction == 'down':
-            self.y[0] += 1
+            self.head_y += 1
         elif self.current_direction == 'left':
-            self.x[0] -= 1
+            self.head_x -= 1
         elif self.current_direction == 'right':
-            self.x[0] += 1
+            self.head_x += 1
+
+        self.head = (self.head - 1) % self.capacity
+        self.body_x[self.head] = self.head_x
+        self.body_y[self.head] = self.head_y
+        self.grid[self.head_x + 1, self.head_y + 1] += 1
 
         self.energy -= 1
         self.steps += 1
 
     def increase(self):
+        # the new segment starts on top of the tail
+        tail = (self.head + self.length - 1) % self.capacity
+        new_tail = (tail + 1) % self.capacity
+        self.body_x[new_tail] = self.body_x[tail]
+        self.body_y[new_tail] = self.body_y[tail]
+        self.grid[self.body_x[tail] + 1, self.body_y[tail] + 1] += 1
         self.length += 1
-        self.x.append(self.x[-1])
-        self.y.append(self.y[-1])
 
     def reset_energy(self):
         self.energy += 60
@@ -88,13 +141,16 @@ class Snake:
 if __name__ == "__main__":
 
     import time
+    import pygame
     from pygame import locals
+    from board_config import BLOCK_SIZE
+    from render import draw_snake
 
     pygame.init()
     window_size = (BOARD_SIZE[0] * BLOCK_SIZE, BOARD_SIZE[1] * BLOCK_SIZE)
     surface = pygame.display.set_mode(window_size)
 
-    new_snake = Snake(surface, (5, 5))
+    new_snake = Snake(None, architecture=(2, 4, 4), initial_pos=(5, 5))
 
     running = True
     paused = False
@@ -130,7 +186,7 @@ if __name__ == "__main__":
                 new_snake.process_inputs((1, 1))
             new_snake.move()
             surface.fill((255, 255, 255))
-            new_snake.draw()
+            draw_snake(surface, new_snake)
             pygame.display.flip()
             print(new_snake)
             time.sleep(0.5)
@@ -0,0 +1,150 @@
+import queue
+import time
+import numpy as np
+import genetic_algorithm as ga
+import selection
+from evaluation import evaluate_genomes
+from random_streams import get_game_keys
+
+
+class SteadyState:
+    """"Steady-state evolution of the population of a World, without the barrier at the end of each generation.
+    Children are bred from the current population in batches of batch_size (one child of a tournament pair, crossed
+    and mutated with the population operators of selection and genetic_algorithm) and each batch is sent to the
+    worker pool of the world as one task, keeping in_flight tasks queued so no worker waits. As soon as a task
+    finishes its children replace the worst individuals and a new batch is bred for the free worker, so a long game
+    only delays its own task.
+
+    Each child plays the game of its own key (the seed of the world, the generation and the number of the child), so
+    it can be played again on its own. Children are not looked up in the fitness cache. The children of the tasks not
+    inserted yet are kept in world.pending_children, so a checkpoint saves them, and the pending children of a
+    loaded checkpoint are evaluated before new ones are bred."""
+    def __init__(self, world, batch_size=32, in_flight=None):
+        self.world = world
+        self.pool = world.evaluator.pool
+        self.batch_size = batch_size
+        # one task running and one waiting per worker
+        self.in_flight = in_flight or 2 * world.evaluator.workers
+        self.results = queue.Queue()
+        self.pending = 0
+        self.births = 0
+        self.evaluations = 0
+        self.evaluation_time = 0.0
+        self.tasks = 0
+        self.waiting = []       # tasks of pending children not submitted yet, from a checkpoint
+        pending = list(world.pending_children.values())
+        world.pending_children.clear()
+        for genomes, seeds in pending:
+            for start in range(0, len(genomes), batch_size):
+                batch = slice(start, start + batch_size)
+                world.pending_children[self.tasks] = (genomes[batch], seeds[batch])
+                self.waiting.append(self.tasks)
+                self.tasks += 1
+
+    def breed(self):
+        # crossover pairs consecutive parents, and the first child of every pair is kept
+        world = self.world
+        parents = selection.tournament_selection(world.fitness_list, 2 * self.batch_size, world.tournament_size)
+        children = ga.crossover_population(world.genomes[parents], world.crossover_rate)[::2].copy()
+        ga.mutate_population(children, world.mutation_rate)
+        return children
+
+    def submit(self):
+        world = self.world
+        if self.waiting:
+            task = self.waiting.pop(0)
+            genomes, seeds = world.pending_children[task]
+        else:
+            genomes = self.breed()
+            seeds = get_game_keys(world.seed, world.generation_number,
+                                  world.population + self.births + np.arange(self.batch_size))
+            self.births += self.batch_size
+            task = self.tasks
+            self.tasks += 1
+            world.pending_children[task] = (genomes, seeds)
+        self.pending += 1
+
+        args = (genomes, seeds, world.nn_architecture, world.vision, True, world.trials, world.aggregate)
+        if self.pool is None:
+            self.results.put((task, evaluate_genomes(*args)))
+        else:
+            self.pool.apply_async(evaluate_genomes, args, callback=lambda result: self.results.put((task, result)),
+                                  error_callback=self.results.put)
+
+    def run(self, evaluations):
+        """Inserts at least evaluations more children into the population and updates the statistics of the world
+        (best_replay is the best child of this run, skipped_steps and played_steps the totals of its games). Tasks
+        still running when it returns are taken by the next call. A population without results is evaluated instead,
+        as a generation of the world."""
+        world = self.world
+        start = time.perf_counter()
+        if len(world.steps_list) != len(world.genomes):
+            world.run_generation_multicore()
+            self.evaluations += len(world.genomes)
+            self.evaluation_time += time.perf_counter() - start
+            return
+        inserted = 0
+        skipped_steps = 0
+        played_steps = 0
+        best_fitness = None
+        while inserted < evaluations:
+            while self.pending < self.in_flight:
+                self.submit()
+            item = self.results.get()
+            self.pending -= 1
+            if isinstance(item, BaseException):
+                raise item
+
+            task, (fitness, steps, apples, best_replay, skipped) = item
+            genomes, seeds = world.pending_children.pop(task)
+            worst = world.replace_worst_individuals(genomes, fitness)
+            world.seeds[worst] = seeds
+            for ind, child_steps, child_apples in zip(worst, steps.tolist(), apples.tolist()):
+                world.steps_list[ind] = child_steps
+                world.apples_list[ind] = child_apples
+            if best_fitness is None or fitness.max() > best_fitness:
+                best_fitness = fitness.max()
+                world.best_replay = best_replay
+            skipped_steps += skipped
+            played_steps += int(steps.sum()) - skipped
+            inserted += len(genomes)
+
+        world.evaluation_time = time.perf_counter() - start
+        world.skipped_steps = skipped_steps
+        world.played_steps = played_steps
+        self.evaluations += inserted
+        self.evaluation_time += world.evaluation_time
+
+    def get_evaluations_per_second(self):
+        return self.evaluations / self.evaluation_time if self.evaluation_time > 0 else 0.0
+
+
+if __name__ == "__main__":
+
+    import multiprocessing
+    from world import World
+
+    # the same number of evaluations in generational and in steady-state mode
+    population = 500
+    generations = 20
+    workers = multiprocessing.cpu_count()
+
+    np.random.seed(0)
+    world = World(population, workers=workers, headless=True, elitism=10)
+    start = time.perf_counter()
+    for _ in range(generations):
+        world.run_generation_multicore()
+        world.create_next_generation()
+    elapsed = time.perf_counter() - start
+    print('  generational | {:.0f} evals/s | Best fitness={}'.format(
+        population * generations / elapsed, max(world.fitness_list)))
+    world.close()
+
+    np.random.seed(0)
+    world = World(population, workers=workers, headless=True)
+    steady_state = SteadyState(world)
+    for _ in range(generations):
+        steady_state.run(population)
+    print('  steady-state | {:.0f} evals/s | Best fitness={}'.format(
+        steady_state.get_evaluations_per_second(), max(world.fitness_list)))
+    world.close()
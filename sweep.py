@@ -0,0 +1,197 @@
+"""Headless hyperparameter sweeps: many independent Worlds over a process pool, streamed into one results file.
+
+Every line of the results file is a JSON record: 'progress' records every progress_every generations of a config and
+a 'result' record when it finishes. Configs are identified by a hash of their settings, so running the same sweep
+again skips the configs that already have a result:
+
+    python sweep.py sweep_results.jsonl --cores 8 --generations 100
+    python sweep.py sweep_results.jsonl --random 50 --seed 1
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import time
+import numpy as np
+
+# lists are the values tried (all of them in a grid, one at random otherwise); (low, high) tuples are uniform ranges
+# for random sweeps
+SPACE = {
+    'mutation_rate': [0.05, 0.1, 0.2],
+    'crossover_rate': [0.5, 0.7, 0.9],
+    'population': [200, 500],
+    'hidden_layers': [[5], [8], [8, 4]],
+    'tournament_size': [2, 3, 5],
+}
+SETTINGS = ('mutation_rate', 'crossover_rate', 'population', 'hidden_layers', 'tournament_size')
+DEFAULTS = {'mutation_rate': 0.1, 'crossover_rate': 0.7, 'population': 100, 'hidden_layers': [5],
+            'tournament_size': 3}
+
+progress_queue = None
+
+
+def grid_configs(space, generations, seed=0):
+    """Returns every combination of the values of the space (ranges are not allowed in a grid)."""
+    names = sorted(space)
+    for name in names:
+        if not isinstance(space[name], list):
+            raise ValueError("Grid sweeps need a list of values for '{}'".format(name))
+    return [dict(zip(names, values), generations=generations, seed=seed)
+            for values in itertools.product(*(space[name] for name in names))]
+
+
+def random_configs(space, count, generations, seed=0):
+    """Returns count configs with every setting drawn from its list of values or from its (low, high) range."""
+    rng = np.random.default_rng(seed)
+    configs = []
+    for _ in range(count):
+        config = {}
+        for name in sorted(space):
+            values = space[name]
+            if isinstance(values, tuple):
+                config[name] = float(rng.uniform(*values))
+            else:
+                config[name] = values[rng.integers(len(values))]
+        configs.append(dict(config, generations=generations, seed=seed))
+    return configs
+
+
+def get_config_id(config):
+    return hashlib.blake2b(json.dumps(config, sort_keys=True).encode(), digest_size=8).hexdigest()
+
+
+def read_finished(path):
+    """Returns the ids of the configs with a result in the results file."""
+    finished = set()
+    if os.path.exists(path):
+        with open(path) as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue            # a line cut short by an interrupted sweep
+                if record.get('type') == 'result':
+                    finished.add(record['id'])
+    return finished
+
+
+def init_worker(queue):
+    global progress_queue
+    progress_queue = queue
+
+
+def run_config(config, progress_every=10):
+    """Evolves a headless World with the settings of config and returns its result record. Progress records are put
+    on the queue of the worker, for the parent process to write."""
+    from world import World
+
+    settings = dict(DEFAULTS, **{name: config[name] for name in SETTINGS if name in config})
+    np.random.seed(config['seed'])
+    world = World(population=settings['population'], headless=True, tournament_size=settings['tournament_size'],
+                  hidden_layers=settings['hidden_layers'])
+    world.mutation_rate = settings['mutation_rate']
+    world.crossover_rate = settings['crossover_rate']
+
+    config_id = get_config_id(config)
+    start = time.perf_counter()
+    best_fitness = []
+    mean_fitness = []
+    for generation in range(config['generations']):
+        world.run_generation_batched()
+        best_fitness.append(max(world.fitness_list))
+        mean_fitness.append(float(np.mean(world.fitness_list)))
+        if progress_queue is not None and (generation + 1) % progress_every == 0:
+            progress_queue.put({'type': 'progress', 'id': config_id, 'generation': generation + 1,
+                                'best_fitness': best_fitness[-1], 'mean_fitness': mean_fitness[-1]})
+        world.create_next_generation()
+    world.close()
+
+    return {'type': 'result', 'id': config_id, 'config': config, 'best_fitness': max(best_fitness),
+            'final_mean_fitness': mean_fitness[-1], 'history': {'best': best_fitness, 'mean': mean_fitness},
+            'seconds': time.perf_counter() - start}
+
+
+class Sweep:
+    """"Sweep runs the configs that have no result yet in the results file, each in its own headless World, on a pool
+    of cores worker processes (the core budget). Workers send their progress and results to this process, which is
+    the only writer of the file and flushes every record, so an interrupted sweep loses at most the configs that were
+    running and can be restarted with the same configs."""
+    def __init__(self, configs, path, cores=None):
+        self.configs = configs
+        self.path = path
+        self.cores = cores or multiprocessing.cpu_count()
+
+    def get_pending(self):
+        finished = read_finished(self.path)
+        pending = {}
+        for config in self.configs:
+            config_id = get_config_id(config)
+            if config_id not in finished:
+                pending[config_id] = config
+        return list(pending.values())
+
+    def run(self):
+        """Runs the pending configs and returns their result records, in the order they finished."""
+        pending = self.get_pending()
+        print('{} configs, {} already finished, {} cores'.format(
+            len(self.configs), len(self.configs) - len(pending), self.cores))
+        if not pending:
+            return []
+
+        queue = multiprocessing.Queue()
+        results = []
+        with open(self.path, 'a') as file, \
+                multiprocessing.Pool(min(self.cores, len(pending)), init_worker, (queue,)) as pool:
+            finishing = pool.imap_unordered(run_config, pending)
+            while len(results) < len(pending):
+                try:
+                    result = finishing.next(timeout=0.5)
+                except multiprocessing.TimeoutError:
+                    result = None
+                self.write_progress(file, queue)
+                if result is not None:
+                    self.write(file, result)
+                    results.append(result)
+                    print('[{}/{}] {} | Best fitness={} \t| {:.1f} s'.format(
+                        len(results), len(pending), result['id'], result['best_fitness'], result['seconds']))
+        return results
+
+    def write_progress(self, file, queue):
+        while not queue.empty():
+            self.write(file, queue.get())
+
+    @staticmethod
+    def write(file, record):
+        file.write(json.dumps(record) + '\n')
+        file.flush()
+
+
+def read_results(path):
+    """Returns the result records of a results file, best first."""
+    with open(path) as file:
+        records = [json.loads(line) for line in file if line.strip()]
+    results = [record for record in records if record.get('type') == 'result']
+    return sorted(results, key=lambda result: result['best_fitness'], reverse=True)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('results', nargs='?', default='sweep_results.jsonl')
+    parser.add_argument('--cores', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--generations', type=int, default=50)
+    parser.add_argument('--random', type=int, default=0, help='number of random configs (grid if 0)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.random:
+        sweep_configs = random_configs(dict(SPACE, mutation_rate=(0.01, 0.3), crossover_rate=(0.3, 1.0)),
+                                       args.random, args.generations, args.seed)
+    else:
+        sweep_configs = grid_configs(SPACE, args.generations, args.seed)
+    Sweep(sweep_configs, args.results, args.cores).run()
+
+    for best in read_results(args.results)[:5]:
+        print('Best fitness={} \t| {}'.format(best['best_fitness'], best['config']))
@@ -0,0 +1,113 @@
+import functools
+import numpy as np
+from board_config import BOARD_SIZE
+
+# rays follow the order of Snake.directions = ('up', 'right', 'down', 'left'), then the diagonals
+RAYS = ((0, -1), (1, 0), (0, 1), (-1, 0), (1, -1), (1, 1), (-1, 1), (-1, -1))
+SENSORS = ('apple', 'wall', 'body', 'apple_ray')
+DEFAULT_SENSORS = ('apple', 'wall')
+
+
+@functools.lru_cache(maxsize=None)
+def build_ray_tables(board_size, rays):
+    """Precomputes, for every board cell and ray, the number of board cells between the cell and the wall and the
+    cells the ray crosses. Cells are flat indices into a grid with a border of one cell (as Snake.grid); the end of
+    each ray is padded with the corner of the border, which is never occupied."""
+    width, height = board_size
+    directions = np.array(RAYS[:rays])
+    steps = np.arange(1, max(board_size))
+
+    x = np.arange(width)[:, None, None, None] + steps * directions[:, 0, None]
+    y = np.arange(height)[None, :, None, None] + steps * directions[:, 1, None]
+    inside = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+
+    wall_distance = inside.sum(axis=-1)
+    ray_cells = np.where(inside, (x + 1) * (height + 2) + (y + 1), 0)
+    return wall_distance, ray_cells
+
+
+def first_hit(hits):
+    # steps along each ray to the first hit, 0 if the ray hits nothing
+    return np.where(hits.any(axis=-1), hits.argmax(axis=-1) + 1, 0)
+
+
+class Vision:
+    """"Vision computes the inputs of the neural network from the state of one or many games. The available sensors
+    are 'apple' (distance to the apple in x and y), 'wall' (cells between the head and the wall along each ray),
+    'body' and 'apple_ray' (steps along each ray to the first body segment or to the apple, 0 if not seen). Rays look
+    in 4 or 8 directions. Wall distances and ray cells come from precomputed tables and body hits are read from the
+    occupancy grids, so a whole population is served by a few array operations per sensor."""
+    def __init__(self, sensors=DEFAULT_SENSORS, rays=4):
+        for sensor in sensors:
+            if sensor not in SENSORS:
+                raise ValueError("Unknown sensor '{}'".format(sensor))
+        if rays not in (4, 8):
+            raise ValueError("Vision supports 4 or 8 rays, not {}".format(rays))
+
+        self.sensors = tuple(sensors)
+        self.rays = rays
+        self.wall_distance, self.ray_cells = build_ray_tables(BOARD_SIZE, rays)
+        self.wall_lists = self.wall_distance.tolist()      # for single games
+
+    def __reduce__(self):
+        # rebuild the tables from the cache instead of pickling them
+        return Vision, (self.sensors, self.rays)
+
+    @property
+    def input_size(self):
+        return sum(2 if sensor == 'apple' else self.rays for sensor in self.sensors)
+
+    def get_inputs(self, head_x, head_y, apple_x, apple_y, grids=None, games=None):
+        """Returns a (games, input_size) array. Heads and apples are arrays with one entry per game; grids are the
+        occupancy grids and games the rows of grids that belong to each head (only needed by the 'body' sensor)."""
+        columns = [self.get_sensor(sensor, head_x, head_y, apple_x, apple_y, grids, games)
+                   for sensor in self.sensors]
+        return np.concatenate(columns, axis=1)
+
+    def get_sensor(self, sensor, head_x, head_y, apple_x, apple_y, grids=None, games=None):
+        # the (games, inputs) columns of one sensor
+        if sensor == 'apple':
+            return np.stack((apple_x - head_x, apple_y - head_y), axis=1)
+        if sensor == 'wall':
+            return self.wall_distance[head_x, head_y]
+        if sensor == 'body':
+            occupancy = grids.reshape(len(grids), -1)
+            hits = occupancy[games[:, None, None], self.ray_cells[head_x, head_y]] > 0
+            return first_hit(hits)
+        apple = (apple_x + 1) * (BOARD_SIZE[1] + 2) + (apple_y + 1)
+        hits = self.ray_cells[head_x, head_y] == apple[:, None, None]
+        return first_hit(hits)
+
+    def get_game_inputs(self, snake, apple):
+        """Inputs of a single game as a list, the same as the row of a population. The apple and wall sensors are
+        read with plain ints; only the body and apple ray sensors go through the arrays of a population of one."""
+        inputs = []
+        for sensor in self.sensors:
+            if sensor == 'apple':
+                inputs += (apple.x - snake.head_x, apple.y - snake.head_y)
+            elif sensor == 'wall':
+                inputs += self.wall_lists[snake.head_x][snake.head_y]
+            else:
+                inputs += self.get_sensor(sensor, np.array([snake.head_x]), np.array([snake.head_y]),
+                                          np.array([apple.x]), np.array([apple.y]), snake.grid[None],
+                                          np.zeros(1, dtype=np.int64))[0].tolist()
+        return inputs
+
+
+if __name__ == "__main__":
+
+    from snake import Snake
+    from apple import Apple
+
+    vision = Vision(sensors=SENSORS, rays=8)
+    snake = Snake(None, architecture=(vision.input_size, 5, 4), initial_pos=(5, 5))
+    for _ in range(4):
+        snake.increase()
+    for direction in ('right', 'right', 'down', 'down', 'left'):
+        snake.current_direction = direction
+        snake.move()
+    apple = Apple(seed=0)
+
+    print('input size:', vision.input_size)
+    print(snake.x, snake.y, apple)
+    print(vision.get_game_inputs(snake, apple))
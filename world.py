@@ -1,186 +1,365 @@
 from game import Game
-from board_config import *
+from batch_game import BatchGame
+from neural_network import PopulationNetwork
+from evaluation import ParallelEvaluator, FitnessCache, evaluate_genomes, check_aggregate
+from vision import Vision
+from random_streams import SPAWN_BLOCK, get_game_keys, get_uniforms
+import checkpoint
+from metrics import MetricsLog
+from replay import load_replays, save_replays
+import os
+import time
 import genetic_algorithm as ga
+import selection
 import numpy as np
-import time
-import pygame
-from pygame import locals
 
-WINDOW_SIZE = (BOARD_SIZE[0] * BLOCK_SIZE, BOARD_SIZE[1] * BLOCK_SIZE)
 
-
-class App:
-    def __init__(self):
-        pygame.init()
-        self.surface = pygame.display.set_mode(WINDOW_SIZE)
+class World:
+    """"The World class contains a population of 'snake games' and evolves the snakes in each game using genetic
+    algorithm. A headless world never imports pygame; otherwise the window is drawn by an App or, with
+    threaded_render, by a RenderThread."""
+    def __init__(self, population=100, workers=1, headless=False, vision=None, elitism=0, cache_size=0, trials=1,
+                 aggregate='mean', threaded_render=False, selection_method='tournament', tournament_size=3,
+                 hidden_layers=(5,), seed=None):
+        check_aggregate(aggregate)
+        # start the worker processes before the window is created
+        self.evaluator = ParallelEvaluator(workers)
         self.running = True
-        self.paused = False
-        self.delay = 0.01
         self.mutation_rate = 0.1
         self.crossover_rate = 0.7
-        self.draw_enabled = True
-
-    def draw_background(self):
-        self.surface.fill(BACKGROUND_COLOR)
-        for column in range(1, BOARD_SIZE[0]):
-            x = column * BLOCK_SIZE
-            pygame.draw.line(self.surface,
-                             color=(200, 200, 200),
-                             start_pos=(x, 0),
-                             end_pos=(x, WINDOW_SIZE[1]))
-
-        for row in range(1, BOARD_SIZE[1]):
-            y = row * BLOCK_SIZE
-            pygame.draw.line(self.surface,
-                             color=(200, 200, 200),
-                             start_pos=(0, y),
-                             end_pos=(WINDOW_SIZE[0], y))
-
-    def handle_events(self):
-        for event in pygame.event.get():
-            if event.type == locals.KEYDOWN:
-                # Esc --> Quit game
-                if event.key == locals.K_ESCAPE:
-                    self.running = False
-                # Enter --> Pause
-                elif event.key == locals.K_RETURN:
-                    self.paused = not self.paused
-                elif event.key == locals.K_d:
-                    self.draw_enabled = not self.draw_enabled
-                elif event.key == locals.K_w:
-                    self.mutation_rate += 0.1
-                    print("mutation_rate = {}".format(self.mutation_rate))
-                elif event.key == locals.K_a:
-                    self.mutation_rate -= 0.1
-                    print("mutation_rate = {}".format(self.mutation_rate))
-                elif event.key == locals.K_1:
-                    self.delay = 0.01
-                elif event.key == locals.K_2:
-                    self.delay = 0.1
-                elif event.key == locals.K_3:
-                    self.delay = 0
-            elif event.type == locals.QUIT:
-                self.running = False
-
-    def show(self):
-        time.sleep(self.delay)
-        pygame.display.flip()
-
-
-class World:
-    """"The World class contains a population of 'snake games' and evolves the snakes in each game using genetic
-    algorithm."""
-    def __init__(self, population=100):
-        self.app = App()
         self.population = population
+        # the apple streams of all games are keyed by this seed (see random_streams)
+        self.seed = seed if seed is not None else int(np.random.randint(2 ** 31))
+        # the input layer follows the sensors enabled in the vision
+        self.vision = vision if vision is not None else Vision()
+        self.nn_architecture = (self.vision.input_size,) + tuple(hidden_layers) + (4,)
+        self.elitism = elitism
+        self.selection_method = selection_method
+        self.tournament_size = tournament_size
+        self.trials = trials
+        self.aggregate = aggregate
+        self.fitness_cache = FitnessCache(cache_size) if cache_size > 0 else None
+        self.cache_hit_rate = 0.0
         self.generation_number = 0
-        self.current_generation = self.get_first_generation()
+        self.genomes = None     # (population, genome length) matrix, one flattened network per row
+        self.seeds = None       # apple stream key of the game of every individual
+        self.colors = None      # (population, 3) snake colours, for drawing
+        self.current_generation = []    # Game objects, built by create_games
+        self.get_first_generation()
         self.fitness_list = []
-
-        # self.crossover_rate = 0.7
-        # self.mutation_rate = 0.3
+        self.steps_list = []
+        self.apples_list = []
+        self.evaluation_time = 0.0
+        self.skipped_steps = 0      # steps of the generation skipped by the cycle detection
+        self.played_steps = 0       # steps of the generation actually simulated: not skipped nor found in the cache
+        self.best_replay = None
+        self.pending_children = {}      # task -> (genomes, seeds) bred by a SteadyState and not inserted yet
+
+        self.app = None
+        self.renderer = None
+        if not headless:
+            if threaded_render:
+                from render import RenderThread
+                self.renderer = RenderThread(self)
+                self.renderer.start()
+            else:
+                from render import App, REPLAY_COLOR
+                self.app = App(self)
+                # the best games are replayed on this one
+                self.replay_game = Game(parameters={}, vision=self.vision, seed=0, color=REPLAY_COLOR)
 
     def get_first_generation(self):
         self.generation_number += 1
-        return [Game(self.app.surface, parameters=None) for _ in range(self.population)]
+        self.genomes = ga.random_genomes(self.population, self.nn_architecture)
+        self.colors = self.get_random_colors()
+        self.seeds = self.get_new_seeds()
+
+    def get_random_colors(self):
+        # one snake colour per individual, as drawn by Snake
+        return np.random.randint(0, 255, (self.population, 3))
+
+    def get_new_seeds(self):
+        # the key of the game of every individual of the current generation
+        return get_game_keys(self.seed, self.generation_number, np.arange(len(self.genomes)))
+
+    def create_games(self):
+        """Returns the Games of the current generation, for the methods that play Game objects (the others play
+        BatchGames built from the genome matrix and the seeds). The Games of the
+        previous call are reset in place and reused (they are only created the first time or for a new architecture);
+        the parameters of each game are views into its row of the genome matrix, and the first blocks of the apple
+        streams of all games are generated together."""
+        spawns = get_uniforms(self.seeds, 0, SPAWN_BLOCK).tolist()
+        games = self.current_generation
+        if games and games[0].snake.brain.architecture != self.nn_architecture:
+            games = []
+        for ind, (genome, seed, color) in enumerate(zip(self.genomes, self.seeds.tolist(), self.colors.tolist())):
+            parameters = ga.reshape_parameters(genome, self.nn_architecture)
+            if ind < len(games):
+                games[ind].vision = self.vision
+                games[ind].reset(seed, parameters, spawns[ind])
+                games[ind].snake.color = tuple(color)
+            else:
+                games.append(Game(parameters, self.vision, self.nn_architecture, seed, color=color,
+                                  spawns=spawns[ind]))
+        del games[len(self.genomes):]
+        self.current_generation = games
+        return games
 
     def create_next_generation(self):
-        parameters_list = [game.snake.brain.parameters for game in self.current_generation]
-
-        mating_pool = [ga.tournament_selection(parameters_list, self.fitness_list)
-                       for _ in range(len(parameters_list))]
-
-        nn_architecture = self.current_generation[0].snake.brain.architecture
-        parent_chromosomes = [ga.flatten_parameters(brain, nn_architecture) for brain in mating_pool]
-        crossed_chromosomes = []
-        for pair in range(0, len(parent_chromosomes), 2):
-            for child in ga.crossover(parent_chromosomes[pair], parent_chromosomes[pair + 1], self.app.crossover_rate):
-                child = ga.mutation(child, self.app.mutation_rate)
-                crossed_chromosomes.append(child)
-
-        # reshape parameters in the neural network architecture
-        new_parameters = []
-        for chromosome in crossed_chromosomes:
-            new_parameters.append(ga.reshape_parameters(chromosome, nn_architecture))
+        """Carries the elitism best individuals over unchanged and breeds the rest from parents chosen with one of
+        selection.METHODS. New individuals get the stream key of the generation and their index; elites and children
+        left unchanged by crossover and mutation keep the seed of their game."""
+        elite = self.get_best_indices(self.elitism)
+        elite_seeds = self.seeds[elite]
+
+        options = {'tournament_size': self.tournament_size} if self.selection_method == 'tournament' else {}
+        parents = selection.select(self.fitness_list, self.population - len(elite), self.selection_method, **options)
+        mating_pool = self.genomes[parents]
+        parent_seeds = self.seeds[parents]
+        children = ga.crossover_population(mating_pool, self.crossover_rate)
+        ga.mutate_population(children, self.mutation_rate)
+        # a child equal to its parent (no crossover nor mutation) plays the parent's game, so its result is in the cache
+        unchanged = (children == mating_pool).all(axis=1)
+        self.genomes = np.concatenate((self.genomes[elite], children)) if len(elite) > 0 else children
 
         self.generation_number += 1
-        self.current_generation = [Game(self.app.surface, parameters=parameters) for parameters in new_parameters]
+        self.seeds = self.get_new_seeds()
+        self.seeds[:len(elite)] = elite_seeds
+        self.seeds[len(elite):][unchanged] = parent_seeds[unchanged]
 
     def run_generation_parallel(self):
-        there_are_games_running = True
-        while there_are_games_running and self.app.running:
+        start = time.perf_counter()
+        batch = self.create_batch_game()
+        colors = self.colors[:50]
+        while not batch.game_over.all() and self.running:
             self.app.handle_events()
             if not self.app.paused:
-                self.app.draw_background()
-                there_are_games_running = False
-                for ind, game in enumerate(self.current_generation):
-                    if not game.game_over:
-                        there_are_games_running = True
-                        game.play()
-                        if ind < 50:        # only draw first 50 snakes
-                            game.draw()
+                batch.play()
+                # only draw the first 50 snakes that are still playing
+                drawn = np.flatnonzero(~batch.game_over[:50])
+                self.app.draw_batch(batch, drawn, colors[drawn])
                 self.app.show()
 
-        # update stats
-        self.fitness_list = [game.snake.fitness for game in self.current_generation]
+        self.update_stats(batch.fitness, batch.steps, batch.apples, start)
+        self.skipped_steps = int(batch.skipped_steps.sum())
+        self.played_steps = int(batch.steps.sum()) - self.skipped_steps
+        self.best_replay = batch.get_replay(batch.fitness.argmax())
+
+    def run_generation_published(self):
+        """As run_generation_parallel, for a threaded render: frames of the first 50 snakes are published to the render
+        thread when it is ready for one, and stepping never waits for the window."""
+        from render import get_batch_cells
+
+        start = time.perf_counter()
+        batch = self.create_batch_game()
+        colors = self.colors[:50]
+        while not batch.game_over.all() and self.running:
+            self.renderer.wait_if_paused()
+            batch.play()
+            if self.renderer.wants_frame():
+                drawn = np.flatnonzero(~batch.game_over[:50])
+                self.renderer.publish_frame(*get_batch_cells(batch, drawn, colors[drawn]))
+
+        self.update_stats(batch.fitness, batch.steps, batch.apples, start)
+        self.skipped_steps = int(batch.skipped_steps.sum())
+        self.played_steps = int(batch.steps.sum()) - self.skipped_steps
+        self.best_replay = batch.get_replay(batch.fitness.argmax())
+
+    def create_batch_game(self):
+        network = PopulationNetwork.from_genomes(self.genomes, self.nn_architecture)
+        return BatchGame(network, self.seeds, self.vision, record=True)
 
     def run_generation_sequential(self):
-        for ind, game in enumerate(self.current_generation):
-            while not game.game_over and self.app.running:
+        start = time.perf_counter()
+        for ind, game in enumerate(self.create_games()):
+            while not game.game_over and self.running:
                 self.app.handle_events()
                 if not self.app.paused:
                     game.play()
                     if ind < 5:         # only draw first 5 snakes
-                        self.app.draw_background()
-                        game.draw()
+                        self.app.draw_games([game])
                         self.app.show()
 
-        # update stats
-        self.fitness_list = [game.snake.fitness for game in self.current_generation]
+        self.update_stats_from_games(start)
 
     def run_generation(self):
-        for game in self.current_generation:
+        start = time.perf_counter()
+        for game in self.create_games():
             while not game.game_over:
                 game.play()
 
-        # update stats
-        self.fitness_list = [game.snake.fitness for game in self.current_generation]
+        self.update_stats_from_games(start)
+
+    def run_generation_batched(self):
+        start = time.perf_counter()
+        fitness, steps, apples, self.best_replay, self.skipped_steps = self.evaluate(
+            lambda genomes, seeds: evaluate_genomes(genomes, seeds, self.nn_architecture, self.vision, True,
+                                                    self.trials, self.aggregate))
+        self.update_stats(fitness, steps, apples, start)
+
+    def run_generation_multicore(self):
+        start = time.perf_counter()
+        fitness, steps, apples, self.best_replay, self.skipped_steps = self.evaluate(
+            lambda genomes, seeds: self.evaluator.evaluate(genomes, seeds, self.nn_architecture, self.vision, True,
+                                                           self.trials, self.aggregate))
+        self.update_stats(fitness, steps, apples, start)
+
+    def evaluate(self, evaluate_genomes):
+        """Evaluates the current generation with evaluate_genomes(genomes, seeds), which returns the fitness, steps and
+        apples arrays, the replay of the best game and the skipped steps (with trials, the fitness is aggregated as in
+        evaluation.aggregate_fitness). Games found in the fitness cache are not played again, and neither are
+        repeated games (the same genome and seed) of the generation; cache_hit_rate is the share of individuals that
+        were not played, and played_steps counts the steps of the games that were."""
+        seeds = self.seeds
+        if self.fitness_cache is None:
+            result = evaluate_genomes(self.genomes, seeds)
+            self.played_steps = int(result[1].sum()) - result[4]
+            return result
+
+        keys = [self.fitness_cache.get_key(genome, seed) for genome, seed in zip(self.genomes, seeds)]
+        first = {}      # the first individual of every key
+        for ind, key in enumerate(keys):
+            first.setdefault(key, ind)
+        results = {key: self.fitness_cache.get(key) for key in first}
+
+        skipped_steps = 0
+        self.played_steps = 0
+        misses = [first[key] for key, entry in results.items() if entry is None]
+        self.cache_hit_rate = 1 - len(misses) / len(keys)
+        if misses:
+            fitness, steps, apples, best_replay, skipped_steps = evaluate_genomes(self.genomes[misses], seeds[misses])
+            self.played_steps = int(steps.sum()) - skipped_steps
+            best_miss = misses[int(np.argmax(fitness))]
+            for ind, values in zip(misses, zip(fitness.tolist(), steps.tolist(), apples.tolist())):
+                results[keys[ind]] = values + (best_replay if ind == best_miss else None,)
+                self.fitness_cache.put(keys[ind], results[keys[ind]])
+
+        entries = [results[key] for key in keys]
+        fitness, steps, apples, replays = zip(*entries)
+        best = int(np.argmax(fitness))
+        best_replay = replays[best]
+        if best_replay is None:
+            # the best game is a cache hit without a replay: play it again
+            _, steps, _, best_replay, skipped = evaluate_genomes(self.genomes[best:best + 1], seeds[best:best + 1])
+            self.played_steps += int(steps.sum()) - skipped
+            self.fitness_cache.put(keys[best], entries[best][:3] + (best_replay,))
+        return np.array(fitness), np.array(steps), np.array(apples), best_replay, skipped_steps
+
+    def update_stats(self, fitness, steps, apples, start):
+        self.fitness_list = np.asarray(fitness).tolist()
+        self.steps_list = np.asarray(steps).tolist()
+        self.apples_list = np.asarray(apples).tolist()
+        self.evaluation_time = time.perf_counter() - start
+
+    def update_stats_from_games(self, start):
+        snakes = [game.snake for game in self.current_generation]
+        self.update_stats([snake.fitness for snake in snakes], [snake.steps for snake in snakes],
+                          [snake.apples for snake in snakes], start)
+        self.skipped_steps = sum(game.skipped_steps for game in self.current_generation)
+        self.played_steps = sum(self.steps_list) - self.skipped_steps
+        self.best_replay = self.current_generation[int(np.argmax(self.fitness_list))].get_replay()
+
+    def get_best_indices(self, number):
+        # fittest first; among equal fitness, the lowest index first
+        return np.argsort(-np.asarray(self.fitness_list), kind='stable')[:number]
+
+    def get_best_individuals(self, number):
+        """Returns copies of the genomes of the fittest individuals and their fitness, best first."""
+        best = self.get_best_indices(number)
+        return np.array(self.genomes[best]), np.array(self.fitness_list)[best]
+
+    def replace_worst_individuals(self, genomes, fitness):
+        """Replaces the least fit individuals (after an evaluation) with the given genomes and their fitness, so
+        they take part in the selection of the next generation. Returns the indices of the replaced individuals."""
+        worst = np.argsort(self.fitness_list, kind='stable')[:len(genomes)]
+        if not self.genomes.flags.writeable:
+            self.genomes = np.array(self.genomes)
+        self.genomes[worst] = genomes
+        for ind, value in zip(worst, np.asarray(fitness).tolist()):
+            self.fitness_list[ind] = value
+        return worst
 
     def draw_best_individual(self):
-        max_fitness_index = np.array(self.fitness_list).argmax()
-        game = self.current_generation[max_fitness_index]
-        game.reset()
-        while not game.game_over and self.app.running:
+        # play back the recorded actions of the best game, without evaluating its network
+        if self.renderer is not None:
+            self.renderer.publish_replay(self.best_replay)
+            return
+        game = self.replay_game
+        game.snake.color = tuple(self.colors[int(np.argmax(self.fitness_list))].tolist())
+        steps = self.best_replay.play(game)
+        while self.running:
             self.app.handle_events()    # also handle events during replay
             if not self.app.paused:
-                game.play()
-                self.app.draw_background()
-                game.draw()
+                if next(steps, None) is None:
+                    break
+                self.app.draw_games([game])
                 self.app.show()
 
+    def handle_events(self):
+        if self.app is not None:
+            self.app.handle_events()
+        if self.renderer is not None:
+            # with a render thread the keys are handled there; a paused window holds training between generations
+            self.renderer.wait_if_paused()
+
+    def is_drawing(self):
+        if self.renderer is not None:
+            return self.renderer.is_drawing()
+        return self.app is not None and self.app.draw_enabled
+
+    def save_checkpoint(self, directory):
+        checkpoint.save_checkpoint(self, directory)
+
+    def load_checkpoint(self, directory, mmap=False):
+        checkpoint.load_checkpoint(self, directory, mmap)
+
+    def close(self, terminate=False):
+        self.evaluator.close(terminate)
+        if self.renderer is not None:
+            self.running = False
+            self.renderer.join()
+
     def print_generation_statistics(self):
         fitness = np.array(self.fitness_list)
-        print('Generation #{} | Fitness: Max={} \tMean={} \tMin={}'.format(
-            self.generation_number, fitness.max(), fitness.mean(), fitness.min()))
+        cache = ''
+        if self.fitness_cache is not None:
+            cache = ' \t| Cache hits={:.1%}'.format(self.cache_hit_rate)
+        print('Generation #{} | Fitness: Max={} \tMean={} \tMin={} \t| Steps skipped={}{}'.format(
+            self.generation_number, fitness.max(), fitness.mean(), fitness.min(), self.skipped_steps, cache))
 
 
 if __name__ == "__main__":
 
     np.random.seed(0)
 
-    world = World(population=500)
+    checkpoint_directory = 'checkpoints'
+    metrics = MetricsLog('metrics')
+    champions = []
+
+    world = World(population=500, workers=4, elitism=10, cache_size=10000, threaded_render=True)
+    if checkpoint.has_checkpoint(checkpoint_directory):
+        world.load_checkpoint(checkpoint_directory)
+        if os.path.exists('champions.rpl'):
+            champions = load_replays('champions.rpl')
 
-    for _ in range(500):
-        world.app.handle_events()
-        world.run_generation()
+    while world.generation_number <= 500:
+        world.handle_events()
+        world.run_generation_multicore()
         world.print_generation_statistics()
+        metrics.log(world)
+        champions.append(world.best_replay)
 
-        if world.app.draw_enabled:
+        if world.is_drawing():
             world.draw_best_individual()
 
         world.create_next_generation()
+        world.save_checkpoint(checkpoint_directory)
 
         # eu te amo meu lindo
 
-        if not world.app.running:
+        if not world.running:
             break
+
+    metrics.close()
+    save_replays('champions.rpl', champions)
+    world.close()